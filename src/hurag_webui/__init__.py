@@ -9,6 +9,7 @@ import yaml
 import logging
 from dotenv import load_dotenv
 from pathlib import Path
+from types import SimpleNamespace
 load_dotenv(Path.cwd() / ".webui.env")
 
 from hurag import conf as hurag_conf
@@ -25,6 +26,14 @@ oa_model_name = os.getenv(f"{hurag_conf.llm.generation}_MODEL")
 
 # -- Initialization --
 
+def _ensure_section(name: str, **defaults) -> None:
+    """Make sure `conf.<name>` exists and fill missing options with defaults."""
+    section = getattr(conf, name, None) or SimpleNamespace()
+    for key, value in defaults.items():
+        if getattr(section, key, None) is None:
+            setattr(section, key, value)
+    setattr(conf, name, section)
+
 # conf
 try:
     with open(Path.cwd() / "webui-config.yaml", "r", encoding="utf-8") as f:
@@ -41,8 +50,81 @@ try:
         )
     if conf.services.ctx_size.lower() not in ["tiny", "medium", "large"]:
         conf.services.ctx_size = "large"
+    conf.services.ctx_size = conf.services.ctx_size.lower()
+    _ensure_section(
+        "services",
+        ctx_tokens={"tiny": 4096, "medium": 8192, "large": 32768}[
+            conf.services.ctx_size
+        ],
+    )
+    _ensure_section("services", max_tokens=conf.services.ctx_tokens // 4)
     conf.mariadb.host = conf.mariadb.host or "localhost"
     conf.mariadb.port = conf.mariadb.port or 3306
+    _ensure_section(
+        "llm",
+        max_concurrent=4,
+        host_max_concurrent=0,
+        max_queue=50,
+        queue_timeout=60,
+        job_linger=300,
+    )
+    _ensure_section(
+        "quota",
+        tokens_per_minute=0,
+        burst=0,
+        scope="user",
+        max_delay=60,
+        overrides={},
+    )
+    _ensure_section(
+        "history",
+        summarize_after=8,
+        keep_rounds=3,
+        checkpoint_interval=3,
+    )
+    _ensure_section(
+        "breaker",
+        failure_ratio=0.5,
+        min_calls=5,
+        window=60,
+        reset_timeout=30,
+        retrieval_timeout=30,
+        llm_timeout=60,
+        knowledge_timeout=10,
+    )
+    _ensure_section(
+        "retrieval",
+        dedup_threshold=0.8,
+        latency_budget=15,
+        latency_window=300,
+        downgrade_queue_depth=20,
+    )
+    _ensure_section(
+        "render",
+        workers=2,
+        max_queue=64,
+        max_live_turns=30,
+        turns_page=10,
+    )
+    _ensure_section(
+        "shared",
+        path="",
+        poll_interval=0.5,
+        event_ttl=60,
+        cache_ttl=600,
+    )
+    _ensure_section(
+        "startup",
+        warmup=True,
+    )
+    _ensure_section(
+        "cache",
+        retrieval_ttl=300,
+        retrieval_size=1024,
+        answer_ttl=3600,
+        answer_size=512,
+        answer_similarity=0,
+    )
 except ValueError as ve:
     raise ve
 except Exception as e:
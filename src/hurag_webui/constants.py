@@ -75,12 +75,28 @@ MAIN_PAGE_STYLES = '''
 .nicegui-markdown h6 { font-size: 18px; font-weight: 600; }
 '''
 
-SCROLL_TO_BOTTOM_JS = """
-(() => {
-    const el = document.getElementById('scrollable-card');
-    if (!el) return false;
-    return el.scrollTop + el.clientHeight >= el.scrollHeight - 20;
-})()
+# Watch a sentinel element in a scrollable list and emit `loadmore` on it once
+# it comes within `{margin}` pixels of the visible area. Called again after
+# each batch, as observing anew reports the current state.
+LOAD_MORE_OBSERVER_JS = """
+(() => {{
+    const arm = (retries) => {{
+        const el = getHtmlElement({sentinel_id});
+        const root = document.getElementById('{root_id}');
+        if (!el || !root) {{
+            if (retries > 0) setTimeout(() => arm(retries - 1), 100);
+            return;
+        }}
+        if (el._loadMoreObserver) el._loadMoreObserver.disconnect();
+        el._loadMoreObserver = new IntersectionObserver((entries) => {{
+            if (entries.some((e) => e.isIntersecting)) {{
+                el.dispatchEvent(new CustomEvent('loadmore'));
+            }}
+        }}, {{ root, rootMargin: '{margin}px 0px {margin}px 0px' }});
+        el._loadMoreObserver.observe(el);
+    }};
+    arm(20);
+}})()
 """
 
 INIT_RSS_SCRIPTS = [
@@ -101,6 +117,8 @@ INIT_RSS_SCRIPTS = [
         title VARCHAR(100) NOT NULL,
         created_ts TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP,
         user_id UUID NOT NULL,
+        summary TEXT NULL,
+        summary_upto INT NOT NULL DEFAULT -1,
         FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
         INDEX idx_title (title),
         INDEX idx_ts (created_ts)
@@ -116,6 +134,10 @@ INIT_RSS_SCRIPTS = [
         likes INT NOT NULL DEFAULT 0,
         dislikes INT NOT NULL DEFAULT 0,
         pair_id UUID NOT NULL,
+        variant_no INT NOT NULL DEFAULT 0,
+        status VARCHAR(20) NOT NULL DEFAULT 'complete',
+        formatted TEXT NULL,
+        mode VARCHAR(20) NULL,
         FOREIGN KEY (session_id) REFERENCES sessions(id) ON DELETE CASCADE,
         INDEX idx_session (session_id),
         INDEX idx_ts (created_ts)
@@ -125,6 +147,7 @@ INIT_RSS_SCRIPTS = [
         query_id UUID NOT NULL,
         segment_id UUID NOT NULL,
         seq_no INT NOT NULL,
+        score DOUBLE NULL,
         PRIMARY KEY (query_id, segment_id),
         FOREIGN KEY (query_id) REFERENCES session_messages(id) ON DELETE CASCADE
     );""",
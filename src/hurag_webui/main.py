@@ -1,7 +1,20 @@
 from . import conf, logger, hurag_conf, db_pool_name, oa_client_name, oa_model_name
-from .models import User, Citation
+from .models import User, Citation, Message, Conversation, MessageRecord
 from .services import login
-from .viewers import user_manager, scroll_to_bottom, show_citations
+from .viewers import (
+    user_manager,
+    scroll_to_bottom,
+    show_citations,
+    MessageList,
+    render_message,
+)
+from .runtime import (
+    collect_metrics,
+    register_metrics,
+    PrecompressedStatic,
+    SelectiveGZipMiddleware,
+    StreamJob,
+)
 from .constants import (
     CHAT_MODES,
     CHAT_MODE_RAG_MODES,
@@ -21,10 +34,13 @@ from .events import (
     Download_response_clicked,
     Show_message_citations_clicked,
 )
-from hurag.retrievers import retrieve
 
 import asyncio
 import os
+from typing import Callable
+
+# Display name of each RAG mode
+_MODE_NAMES = {v: CHAT_MODES[k] for k, v in CHAT_MODE_RAG_MODES.items() if v}
 
 src_dir = os.path.dirname(os.path.abspath(__file__))
 static_dir = os.path.join(src_dir, "static")
@@ -34,7 +50,6 @@ asset = lambda name: os.path.join(static_dir, name)
 from nicegui import ui, app as ui_app
 from nicegui.events import KeyEventArguments
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
 
 # --- FastAPI App Setup ---
 
@@ -69,6 +84,10 @@ async def _startup_app(env_label: str | None = None) -> None:
     from hurag.llm import get_oa_client
     await get_oa_client(client_name=oa_client_name)
 
+    logger.info("Opening shared state ...")
+    from .services import shared_state
+    await shared_state.start()
+
     logger.info(f"HuRAG WebUI App{env_label} startup completed.")
 
 async def _shutdown_app(env_label: str | None = None) -> None:
@@ -79,6 +98,12 @@ async def _shutdown_app(env_label: str | None = None) -> None:
     from hurag.llm import close_oa_client
     logger.info("Closing chat completions client...")
     await close_oa_client()
+    from .services import shared_state
+    logger.info("Closing shared state...")
+    await shared_state.stop()
+    from .viewers.rendering import render_pool
+    logger.info("Shutting down render pool...")
+    render_pool.shutdown()
     logger.info(f"HuRAG WebUI App{env_label} shutdown completed.")
 
 @asynccontextmanager
@@ -100,11 +125,65 @@ async def lifespan(app: FastAPI):
         if startup_successful:
             await _shutdown_app()
 
+def _warm_up() -> None:
+    """
+    Load what the first requests of a worker would load otherwise: the jieba
+    dictionary, bm25s, mdformat and its plugins, the markdown converter, and
+    the prompt templates. Under `gunicorn --preload` this runs once in the
+    master, and the workers share the memory copy-on-write.
+
+    Nothing here creates pools, clients or threads, those are created in each
+    worker on startup or on first use.
+    """
+    import time
+
+    started = time.monotonic()
+    try:
+        import jieba
+        from .fts import tokenize
+        from .prompts import count_tokens
+        from .viewers.rendering import MARKDOWN_EXTRAS, _format_markdown
+
+        jieba.initialize()
+        tokenize(["预热分词词典"])
+        import bm25s  # noqa: F401
+        import hurag.knowledge_base  # noqa: F401
+
+        # Called directly, not in the render pool, to start no threads
+        _format_markdown(
+            "# 预热\n\n- **列表**\n\n| a | b |\n|---|---|\n", MARKDOWN_EXTRAS
+        )
+        count_tokens("预热 warm up")
+    except Exception as e:
+        logger.warning(f"Warm-up failed, loading on first use instead: {e!r}")
+        return
+    logger.info(f"Warm-up completed in {time.monotonic() - started:.1f}s.")
+
+
+if conf.startup.warmup:
+    _warm_up()
+
 app = FastAPI(lifespan=lifespan)
 
-# Mount static directory to serve static files like favicon.svg
-# You can now access your icon at: http://localhost:8082/static/favicon.svg
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+
+@app.get("/metrics")
+async def metrics():
+    """Runtime metrics of the worker process serving this request."""
+    return {"pid": os.getpid(), **collect_metrics()}
+
+# Compress the responses of the API routes when accepted by the client, the
+# static files are served precompressed with an ETag per content-coding
+app.add_middleware(
+    SelectiveGZipMiddleware, minimum_size=1000, exclude=("/static/",)
+)
+
+# Mount static directory to serve static files like favicon.svg, compressed
+# once at startup. You can now access your icon at:
+# http://localhost:8082/static/favicon.svg, or cached for good at the content
+# hashed URL given by static_files.url("favicon.svg")
+static_files = PrecompressedStatic(static_dir)
+register_metrics("static_files", static_files.stats)
+app.mount("/static", static_files, name="static")
 
 # Get storage secret from environment
 storage_secret = os.environ.get("STORAGE_SECRET")
@@ -195,7 +274,7 @@ async def root():
     with user_drawer, ui.column().classes("w-full"):
         # 1. Logo and User Login Button
         with ui.row().classes("items-center justify-left w-full pl-2 gap-1 no-wrap"):
-            ui.image(asset("favicon.ico")).classes("h-6 w-6")
+            ui.image(static_files.url("favicon.ico")).classes("h-6 w-6")
             user_manager_lbl = ui.label().classes(
                 "flex-grow min-w-0 rounded-lg p-2 cursor-pointer "
                 "text-ellipsis no-underline text-gray-900 "
@@ -231,6 +310,19 @@ async def root():
         )
         with message_container:
             ui.markdown("### 你想了解什么？").classes("text-center text-gray-900 mt-48")
+        # Only the turns near the view are live, others are rebuilt on scroll
+        message_list = MessageList(
+            message_container,
+            source=lambda ids: ui_app.storage.client["conversation"].messages(ids),
+            render=lambda message: render_message(
+                message,
+                ui_app.storage.user["current_user"]["username"],
+                message_container,
+                saved=ui_app.storage.user["current_user"]["id"] is not None,
+            ),
+            max_live=conf.render.max_live_turns,
+            page=conf.render.turns_page,
+        )
         # 2. The input_container contains the input area and controls.
         input_container = ui.column().classes("w-full max-w-4xl mx-auto")
         with (
@@ -272,18 +364,143 @@ async def root():
                     send_btn = ui.button(icon="sym_r_send").props("color=emerald-800")
                     with send_btn:
                         ui.tooltip("发送").classes("text-caption")
+                    stop_btn = ui.button(icon="sym_r_stop").props("color=red-800")
+                    with stop_btn:
+                        ui.tooltip("停止生成").classes("text-caption")
+
+    # The task streaming the current response, cancelled to stop generation
+    generation_job: StreamJob | None = None
+    # The task summarizing older turns of the current session
+    compaction_task: asyncio.Task | None = None
+    # Removes the subscription to changes of the user's sessions
+    sessions_subscription: Callable[[], None] | None = None
+    client = ui.context.client
+    client.on_delete(lambda: _follow_sessions(None))
 
     # --- Inner functions ---
 
     async def _init_message_container():
         ui_app.storage.client["current_session_id"] = None
-        ui_app.storage.client["citations"] = {}
-        ui_app.storage.client["messages"] = {}
-        message_container.clear()
+        ui_app.storage.client["conversation"] = _new_conversation()
+        ui_app.storage.client["summary"] = {"text": None, "upto": -1}
+        message_list.reset()
         message_container.classes(remove="flex-grow overflow-y-auto")
         with message_container:
             ui.markdown("### 你想了解什么？").classes("text-center text-gray-900 mt-48")
 
+    async def _show_sessions(user_id: str | None) -> None:
+        from .services import load_sessions_by_user
+        from .viewers import show_session_history
+
+        top_sessions = await load_sessions_by_user(user_id, limit=100)
+        show_session_history(top_sessions, session_history_col)
+
+    async def _refresh_sessions() -> None:
+        """Show the recent sessions again, and in the other pages of the user."""
+        from .services import shared_state, sessions_topic
+
+        user_id = ui_app.storage.user["current_user"]["id"]
+        await _show_sessions(user_id)
+        if user_id is not None:
+            await shared_state.publish(sessions_topic(user_id), client.id)
+
+    def _follow_sessions(user_id: str | None) -> None:
+        """Refresh the recent sessions when changed by another page of the user."""
+        from .services import shared_state, sessions_topic
+
+        nonlocal sessions_subscription
+        if sessions_subscription is not None:
+            sessions_subscription()
+            sessions_subscription = None
+        if user_id is None:
+            return
+
+        async def sessions_changed(origin: str) -> None:
+            if origin != client.id:
+                with client:
+                    await _show_sessions(user_id)
+
+        sessions_subscription = shared_state.subscribe(
+            sessions_topic(user_id), sessions_changed
+        )
+
+    def _new_conversation() -> Conversation:
+        return Conversation(saved=ui_app.storage.user["current_user"]["id"] is not None)
+
+    async def _turn_messages(queries: list[MessageRecord]) -> list[dict[str, str]]:
+        """The given queries and their current responses as chat messages."""
+        conversation = ui_app.storage.client["conversation"]
+        pairs = [(q, conversation.get(q.pair_id)) for q in queries]
+        contents = await conversation.contents(
+            [m.id for pair in pairs for m in pair if m is not None]
+        )
+        messages = []
+        for q, r in pairs:
+            messages.append({"role": "user", "content": contents.get(q.id, "")})
+            if r is not None and r.id in contents:
+                messages.append({"role": "assistant", "content": contents[r.id]})
+        return messages
+
+    async def _chat_history(before_seq_no: int | None = None) -> list[dict[str, str]]:
+        """
+        Queries and their current responses of the session, oldest first.
+        Turns covered by the rolling summary are replaced by the summary.
+        """
+        from .prompts import SUMMARY_MESSAGE_PREFIX
+
+        summary = ui_app.storage.client["summary"]
+        upto = summary["upto"]
+        history = []
+        if summary["text"]:
+            if before_seq_no is None or before_seq_no > upto:
+                history.append(
+                    {
+                        "role": "system",
+                        "content": SUMMARY_MESSAGE_PREFIX + summary["text"],
+                    }
+                )
+        queries = ui_app.storage.client["conversation"].queries(upto, before_seq_no)
+        return history + await _turn_messages(queries)
+
+    async def _compact_history(
+        session_id: str,
+        summary: str | None,
+        queries: list[MessageRecord],
+    ) -> None:
+        """Fold the given queries and their responses into the rolling summary."""
+        from .services import summarize_history, update_session_summary
+
+        to_fold = await _turn_messages(queries)
+        try:
+            text = await summarize_history(summary, to_fold)
+        except Exception as e:
+            logger.warning(f"History summarization failed: {e!r}")
+            return
+        upto = queries[-1].seq_no
+        if ui_app.storage.user["current_user"]["id"] is not None:
+            await update_session_summary(session_id, text, upto)
+        if ui_app.storage.client["current_session_id"] == session_id:
+            ui_app.storage.client["summary"] = {"text": text, "upto": upto}
+        logger.info(f"Session {session_id} history summarized up to #{upto}.")
+
+    def _schedule_compaction() -> None:
+        """Summarize older turns in background once there are too many."""
+        nonlocal compaction_task
+        threshold = conf.history.summarize_after
+        if not threshold or (compaction_task and not compaction_task.done()):
+            return
+        upto = ui_app.storage.client["summary"]["upto"]
+        queries = ui_app.storage.client["conversation"].queries(upto)
+        if len(queries) <= threshold:
+            return
+        compaction_task = asyncio.create_task(
+            _compact_history(
+                ui_app.storage.client["current_session_id"],
+                ui_app.storage.client["summary"]["text"],
+                queries[: -conf.history.keep_rounds or None],
+            )
+        )
+
     # --- Callback functions ---
     async def user_manager_clicked():
         user_manager(ui_app)
@@ -302,22 +519,47 @@ async def root():
         v = e.value
         ui.notify(f"{CHAT_MODES[v]}模式：{CHAT_MODE_DESCRIPTIONS[v]}")
 
-    async def send_message(message: str | None = None):
+    async def send_message(
+        message: str | None = None,
+        use_cache: bool = True,
+        query_msg: MessageRecord | None = None,
+    ):
+        """
+        Send a query and show the response; with `query_msg`, regenerate the
+        response of that query with its stored knowledge as a new variant.
+        """
+        nonlocal generation_job
         from datetime import datetime
         from . import generate_id
         from .viewers import (
             display_user_message,
+            display_bot_message,
             display_message_footer,
-            chat_with_backend,
-            show_session_history,
+            display_generation,
+            display_variant_label,
         )
+        from .viewers.rendering import format_markdown
         from .services import (
             upsert_session,
-            load_sessions_by_user,
+            insert_response_variant,
+            checkpoint_response,
+            finish_response,
+            load_knowledge_by_message,
+            load_response_mode,
             generate_session_title,
+            retrieve_knowledge,
+            select_mode,
+            dedup_knowledge,
+            lookup_answer,
+            store_answer,
+            generate_response,
+            generation_jobs,
         )
 
         # Perpare user query and timestamp
+        conversation = ui_app.storage.client["conversation"]
+        if query_msg is not None:
+            message = await conversation.content(query_msg.id)
         query = message or text_input.value.strip()
         if not query:
             return
@@ -333,13 +575,14 @@ async def root():
         if ui_app.storage.client["current_session_id"] is None:
             # Generate new session's title in background
             task = asyncio.create_task(generate_session_title(query))
-            ui_app.storage.client["citations"] = {}
-            ui_app.storage.client["messages"] = {}
-            message_container.clear()
+            conversation = ui_app.storage.client["conversation"] = _new_conversation()
+            ui_app.storage.client["summary"] = {"text": None, "upto": -1}
+            message_list.reset()
             message_container.classes(add="flex-grow overflow-y-auto")
 
-        # Show user query
-        with message_container:
+        # Show user query in a new turn of the message list
+        turn = await message_list.new_turn()
+        with turn:
             await display_user_message(
                 query,
                 ui_app.storage.user["current_user"]["username"],
@@ -351,17 +594,55 @@ async def root():
         waiting_spinner.set_visibility(True)
         await scroll_to_bottom(message_container)
 
-        # Retrieve knowledge, list of [Knowledge.model_dump(), ...]
-        knowledge_list = [] if mode is None else await retrieve(
-            query=query,
-            history=[
-                m["content"]
-                for m in ui_app.storage.client["messages"].values()
-                if m["role"] == "user"
-            ],
-            mode=mode,
-            user_path=ui_app.storage.user["current_user"]["user_path"],
-        )
+        user_path = ui_app.storage.user["current_user"]["user_path"]
+        history = await _chat_history(query_msg and query_msg.seq_no)
+
+        # Answer the first question of a session from the answer cache if any
+        cached = None
+        if use_cache and mode and not conversation:
+            cached = await lookup_answer(query, mode, user_path)
+
+        # Regenerate in the mode and with the knowledge of the response being
+        # replaced, the current mode is used if its mode is unknown
+        knowledge_list = None
+        if query_msg is not None:
+            mode, knowledge_list = await asyncio.gather(
+                load_response_mode(query_msg.pair_id, default=mode),
+                load_knowledge_by_message(query_msg.pair_id, user_path),
+            )
+            if not mode:
+                knowledge_list = None
+
+        if cached:
+            response, knowledge_list = cached
+            response_ts, status = datetime.now(), "complete"
+            with turn:
+                await display_bot_message(response)
+            ui.notify("已返回相同问题的缓存答案")
+        elif not knowledge_list:
+            # Use a cheaper mode when retrieval is slow or the queue is long
+            selected = select_mode(mode)
+            if selected != mode:
+                logger.info(f"Mode downgraded from {mode} to {selected}")
+                ui.notify(
+                    f"当前负载较高，本次由{_MODE_NAMES[mode]}模式"
+                    f"切换为{_MODE_NAMES[selected]}模式回答",
+                    type="info",
+                )
+                mode = selected
+            # Retrieve knowledge, list of [(Knowledge, score), ...]
+            try:
+                knowledge_list = await retrieve_knowledge(
+                    query=query,
+                    history=[h["content"] for h in history if h["role"] == "user"],
+                    mode=mode,
+                    user_path=user_path,
+                )
+            except Exception as e:
+                # Answer without the knowledge base rather than not at all
+                logger.warning(f"Retrieval failed, fallback to daily mode: {e!r}")
+                ui.notify("知识库检索暂时不可用，本次以日常模式回答", type="warning")
+                mode, knowledge_list = None, []
 
         # Merge retrieved knowledge into cached citations
         ui_app.storage.general["cached_citations"] |= {
@@ -369,99 +650,170 @@ async def root():
             for k in knowledge_list
         }
 
-        # Get current citation IDs
+        # Get current citation IDs, near-duplicates dropped from the prompt
+        # are still cited
         citation_ids = [k[0].segment_id for k in knowledge_list]
 
-        # Chat with backend and get response
-        response, response_ts = await chat_with_backend(
-            message_container,
-            mode,
-            query,
-            knowledge_list,
-            system_prompt=None,
-            history=[
-                {
-                    "role": m["role"],
-                    "content": m["content"],
-                }
-                for m in ui_app.storage.client["messages"].values()
-            ],
-            temperature=0 if mode else 0.6,
-            timeout=180,
-        )
-
-        # Save/Update session, message and citations
-        if ui_app.storage.user["current_user"]["id"] is not None:
-            # Not a guest user
-            if ui_app.storage.client["current_session_id"] is None:
+        # Persist the query and a placeholder of the response right away, the
+        # response is checkpointed while streaming and finished afterwards
+        scores = [k[1] for k in knowledge_list]
+        first_turn = not conversation
+        is_guest = ui_app.storage.user["current_user"]["id"] is None
+        if not is_guest:
+            initial, initial_status = (
+                (response, "complete") if cached else ("", "streaming")
+            )
+            if query_msg is not None:
+                # Regenerated response, a new variant of the same query
+                r = await insert_response_variant(
+                    query_id=query_msg.id,
+                    session_id=ui_app.storage.client["current_session_id"],
+                    response=initial,
+                    response_ts=datetime.now(),
+                    citation_ids=citation_ids,
+                    scores=scores,
+                    status=initial_status,
+                    mode=mode,
+                )
+                query_msg.pair_id = r.id
+                q = query_msg
+                with turn:
+                    await display_variant_label(r.variant_no)
+            elif ui_app.storage.client["current_session_id"] is None:
                 # New session creation logic
-                # 1) Wait and get the generated session title
-                title = await task
-                # 2) Save new session
+                # 1) Save new session, titled by the query until the generated
+                #    title is ready
                 s, q, r = await upsert_session(
                     query=query,
                     query_ts=query_ts,
-                    response=response,
-                    response_ts=response_ts,
+                    response=initial,
+                    response_ts=datetime.now(),
                     citation_ids=citation_ids,
                     session_id=None,
-                    title=title,
+                    title=query[:20],
                     user_id=ui_app.storage.user["current_user"]["id"],
+                    scores=scores,
+                    status=initial_status,
+                    mode=mode,
                 )
-                # 3) Update current_session_id
+                # 2) Update current_session_id
                 ui_app.storage.client["current_session_id"] = s.id
+                # 3) Apply the generated title in background
+                asyncio.create_task(_apply_session_title(s.id, query[:20], task))
             else:
                 # Existing session update logic
-                # 1) Update session
                 _, q, r = await upsert_session(
                     query=query,
                     query_ts=query_ts,
-                    response=response,
-                    response_ts=response_ts,
+                    response=initial,
+                    response_ts=datetime.now(),
                     citation_ids=citation_ids,
                     session_id=ui_app.storage.client["current_session_id"],
+                    scores=scores,
+                    status=initial_status,
+                    mode=mode,
                 )
             # Update current messages
-            ui_app.storage.client["messages"][q.id] = q.model_dump()
-            ui_app.storage.client["messages"][r.id] = r.model_dump()
-            # Update citations
-            if citation_ids:
-                ui_app.storage.client["citations"][r.id] = citation_ids
+            if query_msg is None:
+                conversation.add(q)
             # Refresh recent sessions in the left drawer
-            top_sessions = await load_sessions_by_user(
-                ui_app.storage.user["current_user"]["id"],
-                limit=100,
+            await _refresh_sessions()
+
+        if not cached:
+            # Generate in a server-side job, that keeps going and saves the
+            # response when this client goes away
+            async def generate(job) -> str:
+                status = await generate_response(
+                    job,
+                    mode,
+                    query,
+                    dedup_knowledge(knowledge_list),
+                    system_prompt=None,
+                    history=history,
+                    temperature=0 if mode else 0.6,
+                    timeout=180,
+                    account=account,
+                    user_path=user_path,
+                    on_checkpoint=(
+                        None
+                        if is_guest
+                        else lambda partial: checkpoint_response(r.id, partial)
+                    ),
+                )
+                # Shielded, a stop arriving now must not leave the response
+                # streaming for good
+                await asyncio.shield(finish(job, status))
+                return status
+
+            async def finish(job, status: str) -> None:
+                if mode and status == "complete" and first_turn:
+                    await store_answer(
+                        query, mode, user_path, job.content, knowledge_list
+                    )
+                if not is_guest:
+                    await finish_response(
+                        r.id,
+                        job.content,
+                        datetime.now(),
+                        status,
+                        formatted=await format_markdown(job.content),
+                    )
+
+            account = ui_app.storage.user["current_user"]["account"]
+            generation_job = generation_jobs.start(
+                generate_id() if is_guest else r.id, generate
             )
-            show_session_history(top_sessions, session_history_col)
+            try:
+                response, response_ts, status = await display_generation(
+                    message_container, generation_job, turn
+                )
+            finally:
+                generation_job = None
+            if not is_guest:
+                r = r.model_copy(
+                    update={
+                        "content": response,
+                        "created_ts": response_ts,
+                        "status": status,
+                    }
+                )
+
+        if not is_guest:
+            conversation.add(r)
         else:
             # Guest user, no database saving, only temp storage
             temp_session_id = "guest_session"
             ui_app.storage.client["current_session_id"] = temp_session_id
-            q = {
-                "id": generate_id(),
-                "session_id": temp_session_id,
-                "seq_no": len(ui_app.storage.client["messages"]),
-                "role": "user",
-                "content": query,
-                "created_ts": query_ts,
-            }
-            r = {
-                "id": generate_id(),
-                "session_id": temp_session_id,
-                "seq_no": len(ui_app.storage.client["messages"]) + 1,
-                "role": "assistant",
-                "content": response,
-                "created_ts": response_ts,
-            }
-            ui_app.storage.client["messages"][q["id"]] = q
-            ui_app.storage.client["messages"][r["id"]] = r
+            q = Message(
+                id=generate_id(),
+                session_id=temp_session_id,
+                seq_no=len(conversation),
+                role="user",
+                content=query,
+                created_ts=query_ts,
+            )
+            r = Message(
+                id=generate_id(),
+                session_id=temp_session_id,
+                seq_no=len(conversation) + 1,
+                role="assistant",
+                content=response,
+                created_ts=response_ts,
+                pair_id=q.id,
+            )
+            q.pair_id = r.id
+            conversation.add(q)
+            conversation.add(r)
+
+        message_list.record(turn, [q.id, r.id])
 
         # Add footbar to response message
-        with message_container:
+        with turn:
             await display_message_footer(
                 ui_app.storage.user["current_user"]["id"] and r.id,
                 ui_app.storage.user["current_user"]["id"] and q.id,
                 response_ts,
+                cached=cached is not None,
             )
 
         # End of a round of chat
@@ -469,48 +821,74 @@ async def root():
         await scroll_to_bottom(message_container)
         text_input.run_method("focus")
 
+        # Bound the history of long sessions
+        _schedule_compaction()
+
         # Refresh citations drawer if open
         if citation_drawer.value:
             Show_message_citations_clicked.emit(r.id)
 
+    async def _apply_session_title(
+        session_id: str,
+        provisional: str,
+        title_task: asyncio.Task,
+    ) -> None:
+        """Replace the provisional title of a new session with the generated."""
+        from .services import update_session_title
+
+        try:
+            title = await title_task
+        except Exception as e:
+            logger.warning(f"Session title generation failed: {e!r}")
+            return
+        if title and title != provisional:
+            await update_session_title(session_id, title)
+            await _refresh_sessions()
+
+    async def _sync_generated(message_id: str, job: StreamJob) -> None:
+        """Update the stored message with the result of an attached job."""
+        status = await job.wait()
+        ui_app.storage.client["conversation"].update(
+            message_id, job.content, created_ts=job.finished_ts, status=status
+        )
+
+    async def stop_generation():
+        if generation_job is not None:
+            generation_job.cancel()
+
     async def toggle_citation_drawer():
         if citation_drawer.value:
             citation_drawer.value = False
 
     @User_logged_in.subscribe
     async def user_logged_in_handler():
-        from .services import load_sessions_by_user
-        from .viewers import show_session_history
-
-        top_sessions = await load_sessions_by_user(
-            ui_app.storage.user["current_user"]["id"],
-            limit=100,
-        )
-        show_session_history(top_sessions, session_history_col)
+        user_id = ui_app.storage.user["current_user"]["id"]
+        _follow_sessions(user_id)
+        await _show_sessions(user_id)
         await _init_message_container()
 
     @History_session_clicked.subscribe
     async def history_session_clicked_handler(session_id: str):
         from .viewers import join_history_session
+        from .services import load_session_summary, generation_jobs
 
         ui_app.storage.client["current_session_id"] = session_id
-        ui_app.storage.client["citations"], msgs = await join_history_session(
-            session_id,
-            message_container,
-            ui_app.storage.user["current_user"]["username"],
-        )
-        ui_app.storage.client["messages"] = {m.id: m.model_dump() for m in msgs}
+        msgs = await join_history_session(session_id, message_list)
+        conversation = ui_app.storage.client["conversation"] = _new_conversation()
+        for m in msgs:
+            conversation.add(m)
+        for m in msgs:
+            job = generation_jobs.get(m.id) if m.status == "streaming" else None
+            if job is not None:
+                asyncio.create_task(_sync_generated(m.id, job))
+        summary, upto = await load_session_summary(session_id)
+        ui_app.storage.client["summary"] = {"text": summary, "upto": upto}
         if citation_drawer.value:
             citation_drawer.value = False
 
     @Edit_session_title_clicked.subscribe
     async def edit_session_title_clicked_handler(session_id: str):
-        from .services import (
-            load_session_by_id,
-            update_session_title,
-            load_sessions_by_user,
-        )
-        from .viewers import show_session_history
+        from .services import load_session_by_id, update_session_title
 
         session = await load_session_by_id(session_id)
         if not session:
@@ -535,16 +913,11 @@ async def root():
         if not result:
             return  # cancelled
         await update_session_title(session_id, result)
-        top_sessions = await load_sessions_by_user(
-            ui_app.storage.user["current_user"]["id"],
-            limit=100,
-        )
-        show_session_history(top_sessions, session_history_col)
+        await _refresh_sessions()
 
     @Delete_session_clicked.subscribe
     async def delete_session_clicked_handler(session_id: str):
-        from .services import delete_session_by_id, load_sessions_by_user
-        from .viewers import show_session_history
+        from .services import delete_session_by_id
 
         with ui.dialog() as dialog, ui.card().classes("w-96 pt-6 gap-0"):
             ui.label("确认删除该对话？此操作不可撤销。").classes("text-base mx-auto")
@@ -560,74 +933,69 @@ async def root():
             await delete_session_by_id(session_id)
             ui.notify("对话已删除", type="positive")
             # Refresh session history
-            top_sessions = await load_sessions_by_user(
-                ui_app.storage.user["current_user"]["id"],
-                limit=100,
-            )
-            show_session_history(top_sessions, session_history_col)
+            await _refresh_sessions()
             # If deleted session is current, init message container
             if ui_app.storage.client["current_session_id"] == session_id:
                 await _init_message_container()
 
     @Pin_session_clicked.subscribe
     async def pin_session_clicked_handler(session_id: str):
-        from .services import (
-            pin_session_by_id,
-            load_sessions_by_user,
-        )
-        from .viewers import show_session_history
+        from .services import pin_session_by_id
 
         await pin_session_by_id(session_id)
-        top_sessions = await load_sessions_by_user(
-            ui_app.storage.user["current_user"]["id"],
-            limit=100,
-        )
-        show_session_history(top_sessions, session_history_col)
+        await _refresh_sessions()
 
     @Copy_response_clicked.subscribe
     async def copy_response_clicked_handler(message_id: str):
-        msg = ui_app.storage.client["messages"].get(message_id)
-        if msg:
-            ui.clipboard.write(msg["content"])
+        content = await ui_app.storage.client["conversation"].content(message_id)
+        if content is not None:
+            ui.clipboard.write(content)
             ui.notify("已复制到剪贴板")
         else:
             ui.notify("消息未找到，复制失败", type="negative")
 
     @Regenerate_response_clicked.subscribe
     async def regenerate_response_clicked_handler(message_id: str):
-        msg = ui_app.storage.client["messages"].get(message_id)
-        await send_message(msg["content"])
+        msg = ui_app.storage.client["conversation"].get(message_id)
+        if msg:
+            await send_message(use_cache=False, query_msg=msg)
 
     @Like_response_clicked.subscribe
     async def like_response_clicked_handler(e, message_id: str):
-        msg = ui_app.storage.client["messages"].get(message_id)
-        msg["likes"] = 1 - msg["likes"]
-        e.sender.props("color=amber-600" if msg["likes"] else "color=gray-500")
+        msg = ui_app.storage.client["conversation"].get(message_id)
+        msg.likes = 1 - msg.likes
+        e.sender.props("color=amber-600" if msg.likes else "color=gray-500")
         from .services import like_message
 
-        await like_message(msg["id"], msg["likes"])
+        await like_message(msg.id, msg.likes)
 
     @Dislike_response_clicked.subscribe
     async def dislike_response_clicked_handler(e, message_id: str):
-        msg = ui_app.storage.client["messages"].get(message_id)
-        msg["dislikes"] = 1 - msg["dislikes"]
-        e.sender.props("color=amber-600" if msg["dislikes"] else "color=gray-500")
+        msg = ui_app.storage.client["conversation"].get(message_id)
+        msg.dislikes = 1 - msg.dislikes
+        e.sender.props("color=amber-600" if msg.dislikes else "color=gray-500")
         from .services import dislike_message
 
-        await dislike_message(msg["id"], msg["dislikes"])
+        await dislike_message(msg.id, msg.dislikes)
 
     @Download_response_clicked.subscribe
     async def download_response_clicked_handler(message_id: str):
-        msg = ui_app.storage.client["messages"].get(message_id)
-        if msg:
+        content = await ui_app.storage.client["conversation"].content(message_id)
+        if content is not None:
             filename = f"response_{message_id}.md"
-            ui.download.content(msg["content"], filename)
+            ui.download.content(content, filename)
         else:
             ui.notify("消息未找到，下载失败", type="negative")
 
     @Show_message_citations_clicked.subscribe
     async def show_message_citations_clicked_handler(message_id: str):
-        citation_ids = ui_app.storage.client["citations"].get(message_id, [])
+        from .services import load_citation_ids_by_message
+
+        citation_ids = (
+            await load_citation_ids_by_message(message_id)
+            if ui_app.storage.client["conversation"].saved
+            else []
+        )
         citations_badge.set_text(str(len(citation_ids)) if citation_ids else "0")
         if not citation_drawer.value:
             citation_drawer.value = True
@@ -662,6 +1030,8 @@ async def root():
     modes_tgl.bind_enabled_from(waiting_spinner, "visible", backward=lambda v: not v)
     upload_btn.bind_enabled_from(waiting_spinner, "visible", backward=lambda v: not v)
     send_btn.bind_enabled_from(waiting_spinner, "visible", backward=lambda v: not v)
+    send_btn.bind_visibility_from(waiting_spinner, "visible", backward=lambda v: not v)
+    stop_btn.bind_visibility_from(waiting_spinner, "visible")
 
     user_manager_lbl.on("click", user_manager_clicked)
     new_session_btn.on_click(new_session_clicked)
@@ -669,6 +1039,7 @@ async def root():
     modes_tgl.on_value_change(mode_changed)
     upload_btn.on_click(lambda: ui.notify("上传附件功能待实现"))
     send_btn.on_click(send_message)
+    stop_btn.on_click(stop_generation)
 
     # --- Keyboard event handler for the textarea ---
     text_input.on(
@@ -706,12 +1077,12 @@ async def root():
         # {id: Citation.model_dump(), ...}
         ui_app.storage.general["cached_citations"] = {}
 
-    # current session and its citation id set
+    # current session and its messages
     ui_app.storage.client["current_session_id"] = None
-    # {msg_id: [citation_id, ...], ...}
-    ui_app.storage.client["citations"] = {}
-    # {msg_id: Message.model_dump(), ...}
-    ui_app.storage.client["messages"] = {}
+    # the messages of the session, without their contents for saved ones
+    ui_app.storage.client["conversation"] = _new_conversation()
+    # rolling summary of older turns, {"text": str | None, "upto": seq_no}
+    ui_app.storage.client["summary"] = {"text": None, "upto": -1}
 
     # --- Test Area, remove in production ---
 
@@ -1,10 +1,13 @@
 from .citation import Citation
 from .user import User
 from .session import Session, Message
+from .conversation import Conversation, MessageRecord
 
 __all__ = [
     "Citation",
     "User",
     "Session",
     "Message",
+    "Conversation",
+    "MessageRecord",
 ]
@@ -0,0 +1,160 @@
+from datetime import datetime
+from typing import Any, Iterator
+
+from .session import Message
+
+
+class MessageRecord:
+    """The fields of a message kept per client, without its content."""
+
+    __slots__ = (
+        "id",
+        "seq_no",
+        "role",
+        "pair_id",
+        "variant_no",
+        "created_ts",
+        "likes",
+        "dislikes",
+        "status",
+        "content",
+    )
+
+    def __init__(self, message: Message, keep_content: bool = False):
+        self.id: str = message.id
+        self.seq_no: int = message.seq_no
+        self.role: str = message.role
+        self.pair_id: str | None = message.pair_id
+        self.variant_no: int = message.variant_no
+        self.created_ts: datetime | None = message.created_ts
+        self.likes: int = message.likes
+        self.dislikes: int = message.dislikes
+        self.status: str = message.status
+        # Only for unsaved messages, that cannot be loaded again
+        self.content: str | None = message.content if keep_content else None
+
+    def to_dict(
+        self, content: str | None, formatted: str | None = None
+    ) -> dict[str, Any]:
+        """The message as a dict of Message fields, with the given content."""
+        return {
+            "id": self.id,
+            "seq_no": self.seq_no,
+            "role": self.role,
+            "content": content,
+            "created_ts": self.created_ts,
+            "likes": self.likes,
+            "dislikes": self.dislikes,
+            "pair_id": self.pair_id,
+            "variant_no": self.variant_no,
+            "status": self.status,
+            "formatted": formatted,
+        }
+
+
+class Conversation:
+    """
+    The messages of the current session of a client, as compact records.
+
+    The contents of saved messages are not kept per client. They are loaded
+    by ID when needed, from a cache shared by the clients of the worker or
+    from the database. Unsaved messages, those of guests, keep their content
+    in their records.
+    """
+
+    __slots__ = ("saved", "_records")
+
+    def __init__(self, saved: bool = True):
+        self.saved = saved
+        self._records: dict[str, MessageRecord] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, message_id: str) -> bool:
+        return message_id in self._records
+
+    def __iter__(self) -> Iterator[MessageRecord]:
+        return iter(self._records.values())
+
+    def get(self, message_id: str | None) -> MessageRecord | None:
+        return self._records.get(message_id)
+
+    def add(self, message: Message) -> MessageRecord:
+        """Add or replace a message, its content is cached if saved."""
+        record = MessageRecord(message, keep_content=not self.saved)
+        self._records[record.id] = record
+        if self.saved and message.content is not None:
+            from ..services import remember_message_contents
+
+            remember_message_contents({record.id: message.content})
+        return record
+
+    def update(self, message_id: str, content: str, **fields: Any) -> None:
+        """Update the content and fields of a message, if in the conversation."""
+        record = self._records.get(message_id)
+        if record is None:
+            return
+        for name, value in fields.items():
+            setattr(record, name, value)
+        if self.saved:
+            from ..services import remember_message_contents
+
+            remember_message_contents({message_id: content})
+        else:
+            record.content = content
+
+    def queries(
+        self, after: int = -1, before: int | None = None
+    ) -> list[MessageRecord]:
+        """The queries with `after < seq_no < before`, oldest first."""
+        return sorted(
+            (
+                m
+                for m in self._records.values()
+                if m.role == "user"
+                and m.seq_no > after
+                and (before is None or m.seq_no < before)
+            ),
+            key=lambda m: m.seq_no,
+        )
+
+    async def contents(self, message_ids: list[str]) -> dict[str, str]:
+        """The contents of the given messages, by ID."""
+        if not self.saved:
+            return {
+                i: self._records[i].content or ""
+                for i in message_ids
+                if i in self._records
+            }
+        from ..services import load_message_contents
+
+        return await load_message_contents(
+            [i for i in message_ids if i in self._records]
+        )
+
+    async def content(self, message_id: str) -> str | None:
+        """The content of a message, None if not in the conversation."""
+        return (await self.contents([message_id])).get(message_id)
+
+    async def messages(self, message_ids: list[str]) -> dict[str, dict[str, Any]]:
+        """The given messages as dicts of Message fields, by ID."""
+        contents = await self.contents(message_ids)
+        formatted = {}
+        if self.saved:
+            from ..services import load_formatted_messages
+
+            formatted = await load_formatted_messages(
+                [
+                    i
+                    for i in message_ids
+                    if i in self._records
+                    and self._records[i].role != "user"
+                    and self._records[i].status != "streaming"
+                ]
+            )
+        return {
+            i: self._records[i].to_dict(contents.get(i, ""), formatted.get(i))
+            for i in message_ids
+            if i in self._records
+        }
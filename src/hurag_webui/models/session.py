@@ -13,6 +13,12 @@ class Message(BaseModel):
     likes: int = Field(default=0, compare=False)
     dislikes: int = Field(default=0, compare=False)
     pair_id: str | None = Field(default=None, compare=False)
+    variant_no: int = Field(default=0, compare=False)
+    status: str = Field(default="complete", compare=False)  # streaming, aborted
+    # Content formatted for display, not kept in client storage
+    formatted: str | None = Field(
+        default=None, compare=False, repr=False, exclude=True
+    )
 
     def from_db_response(self, resp: tuple) -> Self:
         self.id = resp[0]
@@ -24,6 +30,9 @@ class Message(BaseModel):
         self.likes = resp[6]
         self.dislikes = resp[7]
         self.pair_id = resp[8]
+        self.variant_no = resp[9]
+        self.status = resp[10]
+        self.formatted = resp[11]
         return self
 
 
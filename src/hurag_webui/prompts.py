@@ -4,6 +4,11 @@ from typing import Any, TYPE_CHECKING
 if TYPE_CHECKING:
     from hurag.schemas import Knowledge
 
+from . import logger
+
+import math
+import re
+
 RAG_PROMPT_TEMPLATE = """你是一名知识库问答助手，能够根据提供的相关知识段，准确且简洁地回答用户的问题。
 
 ## 任务
@@ -40,54 +45,209 @@ RAG_PROMPT_TEMPLATE = """你是一名知识库问答助手，能够根据提供
 ## 请回答：
 """
 
-def create_rag_prompt(
-    query: str,
-    knowledge_list: list[tuple[Knowledge, float]],
-    kn_limit: int | None = None,
+SUMMARY_PROMPT_TEMPLATE = """请将以下对话内容压缩为一段简洁的摘要，供后续对话参考。
+
+## 要求
+
+1. 保留用户关注的问题、关键事实、结论、涉及的文件名称和文号等信息。
+2. 如有已有摘要，将其与新的对话内容合并为一份完整的摘要。
+3. 使用第三人称客观陈述，不要编造内容，不超过 {max_length} 字。
+
+## 已有摘要
+
+{summary}
+
+## 对话内容
+
+{dialogue}
+
+## 请输出摘要：
+"""
+
+SUMMARY_MESSAGE_PREFIX = "以下是此前对话的摘要，供回答时参考：\n\n"
+
+# --- Token counting ---
+
+_TOKEN_PATTERN = re.compile(
+    r"[\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7af]"  # CJK, ~1 token per char
+    r"|[A-Za-z0-9]+"  # latin words and numbers, ~4 chars per token
+    r"|[^\sA-Za-z0-9]"  # punctuations and other symbols
+)
+_MESSAGE_OVERHEAD = 4  # role and separators of a chat message
+_MIN_SEGMENT_TOKENS = 64  # do not bother to include shorter truncated segments
+_KNOWLEDGE_SHARE = 0.75  # share of the budget for knowledge if there is history
+
+
+def count_tokens(text: str | None) -> int:
+    """
+    Estimate the number of tokens of a text.
+
+    The estimation is deliberately conservative for the BPE tokenizers of
+    common Chinese LLMs: one token per CJK character or symbol, and one token
+    per four characters of latin words and numbers.
+
+    Arguments:
+        text: The text to count.
+    Returns:
+        The estimated token count.
+    """
+    if not text:
+        return 0
+    return sum(
+        math.ceil(len(t) / 4) if t[0].isascii() and t[0].isalnum() else 1
+        for t in _TOKEN_PATTERN.findall(text)
+    )
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut the text so that it fits into `max_tokens` tokens."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(text[:mid]) <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+# --- Prompt construction ---
+
+
+def _format_segment(
+    idx: int,
+    knowledge: Knowledge,
+    score: float,
+    content: str | None = None,
 ) -> str:
+    """Format a knowledge segment, optionally with replaced content."""
+    content = (knowledge.content if content is None else content).strip()
+    metadata = knowledge.metadata
+    _title = metadata.title
+    _sn = metadata.sn
+    _date = metadata.date
+    _valid_from = metadata.valid_from
+    _valid_to = f"{metadata.valid_to:%Y-%m-%d}" if metadata.valid_to else "未废止"
+    _replaces = metadata.replaces
+    _localizes = metadata.localizes
+    _pub_path = metadata.pub_path
+
+    return (
+        f"### 知识段 {idx + 1}\n"
+        f"- **内容**: {content}\n"
+        f"- **相关性分数**: {score:.4f}\n"
+        f"- **文档元数据**: \n"
+        f"  - **文档标题**: {_title}\n"
+        f"  - **法令号/文号**: { _sn if _sn else '无' }\n"
+        f"  - **发布日期**: {_date:%Y-%m-%d}\n"
+        f"  - **生效日期**: {_valid_from:%Y-%m-%d}\n"
+        f"  - **废止日期**: {_valid_to}\n"
+        f"  - **上一版本**: {_replaces if _replaces else '无'}\n"
+        f"  - **上位版本**: {_localizes if _localizes else '无'}\n"
+        f"  - **发布机构路径**: {_pub_path}"
+    )
+
+
+def pack_prompt(
+    query: str,
+    knowledge_list: list[tuple[Knowledge, float]] | None,
+    history: list[dict[str, str]],
+    budget: int,
+    system_prompt: str | None = None,
+) -> tuple[str, list[dict[str, str]], int]:
     """
-    Create a prompt for RAG based on the user query and knowledge segments.
+    Pack the prompt and chat history into a token budget.
+
+    Knowledge segments are ranked by score and added while they fit, the
+    segment that overflows is truncated if the remaining room is worth it.
+    The rest of the budget is filled with the most recent history messages;
+    system messages in the history, e.g. a summary of older turns, are kept
+    ahead of them.
 
     Arguments:
         query: The user query.
-        knowledge_list: The list of knowledge segments.
-        kn_limit: The maximum number of knowledge segments to include.
+        knowledge_list: The knowledge segments, None for a plain chat prompt.
+        history: The chat history messages, oldest first.
+        budget: The maximum number of prompt tokens.
+        system_prompt: The system prompt.
     Returns:
-        The constructed prompt string.
+        A tuple containing:
+            - The constructed prompt string.
+            - The history messages that fit into the budget.
+            - The estimated number of prompt tokens.
     """
-    knowledge_segments = []
-    for idx, item in enumerate(
-        knowledge_list[:kn_limit] if kn_limit else knowledge_list
-    ):
-        content = item[0].content.strip()
-        score = item[1]
-        metadata = item[0].metadata
-        _title = metadata.title
-        _sn = metadata.sn
-        _date = metadata.date
-        _valid_from = metadata.valid_from
-        _valid_to = f"{metadata.valid_to:%Y-%m-%d}" if metadata.valid_to else "未废止"
-        _replaces = metadata.replaces
-        _localizes = metadata.localizes
-        _pub_path = metadata.pub_path
-
-        knowledge_segments.append(
-            f"### 知识段 {idx + 1}\n"
-            f"- **内容**: {content}\n"
-            f"- **相关性分数**: {score:.4f}\n"
-            f"- **文档元数据**: \n"
-            f"  - **文档标题**: {_title}\n"
-            f"  - **法令号/文号**: { _sn if _sn else '无' }\n"
-            f"  - **发布日期**: {_date:%Y-%m-%d}\n"
-            f"  - **生效日期**: {_valid_from:%Y-%m-%d}\n"
-            f"  - **废止日期**: {_valid_to}\n"
-            f"  - **上一版本**: {_replaces if _replaces else '无'}\n"
-            f"  - **上位版本**: {_localizes if _localizes else '无'}\n"
-            f"  - **发布机构路径**: {_pub_path}"
+    fixed = _MESSAGE_OVERHEAD
+    if system_prompt:
+        fixed += count_tokens(system_prompt) + _MESSAGE_OVERHEAD
+
+    if knowledge_list is None:
+        prompt = query
+        fixed += count_tokens(prompt)
+        available = budget - fixed
+    else:
+        fixed += count_tokens(
+            RAG_PROMPT_TEMPLATE.format(knowledge_segments="", query=query)
+        )
+        available = budget - fixed
+        kn_budget = int(available * _KNOWLEDGE_SHARE) if history else available
+
+        segments = []
+        used = 0
+        truncated = 0
+        ranked = sorted(knowledge_list, key=lambda k: k[1], reverse=True)
+        for knowledge, score in ranked:
+            left = kn_budget - used
+            text = _format_segment(len(segments), knowledge, score)
+            tokens = count_tokens(text) + 2  # separator
+            if tokens > left:
+                content_tokens = count_tokens(knowledge.content.strip())
+                room = left - (tokens - content_tokens)
+                if room < _MIN_SEGMENT_TOKENS:
+                    continue
+                content = _truncate_to_tokens(knowledge.content.strip(), room - 2)
+                text = _format_segment(
+                    len(segments), knowledge, score, content + "……"
+                )
+                tokens = count_tokens(text) + 2
+                truncated += 1
+            segments.append(text)
+            used += tokens
+        prompt = RAG_PROMPT_TEMPLATE.format(
+            knowledge_segments="\n\n".join(segments),
+            query=query,
+        )
+        available -= used
+        if len(segments) < len(knowledge_list) or truncated:
+            logger.debug(
+                f"Packed {len(segments)}/{len(knowledge_list)} knowledge "
+                f"segments, {truncated} truncated."
+            )
+
+    # Pinned system messages first, then fill the rest with the most recent
+    pinned = []
+    for message in history:
+        if message["role"] != "system":
+            continue
+        tokens = count_tokens(message["content"]) + _MESSAGE_OVERHEAD
+        if tokens <= available:
+            pinned.append(message)
+            available -= tokens
+    history = [m for m in history if m["role"] != "system"]
+    packed_history = []
+    for message in reversed(history):
+        tokens = count_tokens(message["content"]) + _MESSAGE_OVERHEAD
+        if tokens > available:
+            break
+        packed_history.append(message)
+        available -= tokens
+    packed_history.reverse()
+    # Do not start the history with an orphan response
+    while packed_history and packed_history[0]["role"] != "user":
+        available += (
+            count_tokens(packed_history.pop(0)["content"]) + _MESSAGE_OVERHEAD
         )
 
-    prompt = RAG_PROMPT_TEMPLATE.format(
-        knowledge_segments="\n\n".join(knowledge_segments),
-        query=query,
-    )
-    return prompt
+    prompt_tokens = budget - available
+    return prompt, pinned + packed_history, prompt_tokens
@@ -0,0 +1,28 @@
+from .cache import TTLCache
+from .admission import AdmissionController, AdmissionRejected, AdmissionTimeout
+from .quota import QuotaManager, QuotaExceeded
+from .breaker import CircuitBreaker, CircuitOpen
+from .jobs import StreamJob, JobRegistry
+from .render import RenderPool
+from .static import PrecompressedStatic, SelectiveGZipMiddleware
+from .shared import SharedState
+from .metrics import register_metrics, collect_metrics
+
+__all__ = [
+    "TTLCache",
+    "AdmissionController",
+    "AdmissionRejected",
+    "AdmissionTimeout",
+    "QuotaManager",
+    "QuotaExceeded",
+    "CircuitBreaker",
+    "CircuitOpen",
+    "StreamJob",
+    "JobRegistry",
+    "RenderPool",
+    "PrecompressedStatic",
+    "SelectiveGZipMiddleware",
+    "SharedState",
+    "register_metrics",
+    "collect_metrics",
+]
@@ -0,0 +1,255 @@
+import asyncio
+import bisect
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable
+
+try:
+    import fcntl
+except ImportError:  # Windows, host-wide slots are unavailable
+    fcntl = None
+
+from .. import logger
+
+
+class AdmissionRejected(RuntimeError):
+    """The wait queue is full."""
+
+
+class AdmissionTimeout(TimeoutError):
+    """Waited too long in the queue."""
+
+
+class _Waiter:
+    __slots__ = ("future", "on_wait", "start", "finish")
+
+    def __init__(
+        self,
+        future: asyncio.Future,
+        on_wait: Callable[[int], Any] | None,
+        start: float,
+        finish: float,
+    ):
+        self.future = future
+        self.on_wait = on_wait
+        self.start = start
+        self.finish = finish
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.finish < other.finish
+
+
+class AdmissionController:
+    """
+    Limit concurrent requests to a backend with a bounded wait queue.
+
+    Waiting requests are admitted by weighted fair queuing (start-time fair
+    queuing): each request is tagged with a virtual finish time of
+    `max(virtual_time, last finish of its key) + cost / weight`, so a key
+    issuing many or costly requests waits behind the light ones. Requests
+    without a key are all of the same key, i.e. a plain FIFO queue.
+
+    The limit applies to the current worker process. If `host_max_concurrent`
+    is set, requests also take one of that many slots shared by all worker
+    processes on the host, implemented by `flock` on slot files.
+
+    Usage:
+        async with controller.slot(on_wait=lambda pos: ...):
+            ...  # call the backend
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int,
+        max_queue: int,
+        timeout: float,
+        host_max_concurrent: int = 0,
+    ):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.host_max_concurrent = host_max_concurrent if fcntl else 0
+        if host_max_concurrent and not fcntl:
+            logger.warning(f"Host-wide admission of {name} is not supported here.")
+        self._active = 0
+        self._waiters: list[_Waiter] = []  # ordered by finish tag
+        self._virtual_time = 0.0
+        self._last_finish: dict[str, float] = {}
+        self._slot_fds: list[int] | None = None  # opened lazily, after fork
+        self._slot_pid: int | None = None
+        self._held_slots: set[int] = set()
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests waiting for a slot in this worker."""
+        return len(self._waiters)
+
+    # --- Local queue ---
+
+    def _notify_positions(self) -> None:
+        for position, waiter in enumerate(self._waiters, start=1):
+            if waiter.on_wait:
+                try:
+                    waiter.on_wait(position)
+                except Exception as e:
+                    logger.debug(f"Admission position callback error: {e!r}")
+
+    def _tag(self, key: str, weight: float, cost: float) -> tuple[float, float]:
+        start = max(self._virtual_time, self._last_finish.get(key, 0.0))
+        finish = start + cost / max(weight, 1e-6)
+        self._last_finish[key] = finish
+        if len(self._last_finish) > 1024:
+            # Keys that finished in the virtual past carry no state
+            self._last_finish = {
+                k: f for k, f in self._last_finish.items() if f > self._virtual_time
+            }
+        return start, finish
+
+    def _release_local(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.pop(0)
+            if not waiter.future.done():
+                self._virtual_time = max(self._virtual_time, waiter.start)
+                waiter.future.set_result(True)  # hand the slot over
+                self._notify_positions()
+                return
+        self._active -= 1
+
+    async def _acquire_local(
+        self,
+        deadline: float,
+        on_wait: Callable[[int], Any] | None,
+        key: str,
+        weight: float,
+        cost: float,
+    ) -> None:
+        if self._active < self.max_concurrent and not self._waiters:
+            start, _ = self._tag(key, weight, cost)
+            self._virtual_time = max(self._virtual_time, start)
+            self._active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected(f"{self.name} queue is full")
+
+        start, finish = self._tag(key, weight, cost)
+        waiter = _Waiter(
+            asyncio.get_running_loop().create_future(), on_wait, start, finish
+        )
+        bisect.insort_right(self._waiters, waiter)
+        self._notify_positions()
+        try:
+            await asyncio.wait_for(waiter.future, deadline - time.monotonic())
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release_local()  # got the slot at the last moment
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._notify_positions()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.timeouts += 1
+            raise AdmissionTimeout(f"{self.name} queue timeout") from None
+
+    # --- Host-wide slots ---
+
+    def _open_slots(self) -> list[int]:
+        if self._slot_pid != os.getpid():
+            # A forked process shares the open files, and so the locks on them
+            self._slot_fds, self._slot_pid = None, os.getpid()
+            self._held_slots.clear()
+        if self._slot_fds is None:
+            slot_dir = os.path.join(tempfile.gettempdir(), f"hurag_webui-{self.name}")
+            os.makedirs(slot_dir, exist_ok=True)
+            self._slot_fds = [
+                os.open(
+                    os.path.join(slot_dir, f"slot-{i}.lock"),
+                    os.O_RDWR | os.O_CREAT,
+                )
+                for i in range(self.host_max_concurrent)
+            ]
+        return self._slot_fds
+
+    async def _acquire_host(self, deadline: float) -> int:
+        fds = self._open_slots()
+        while True:
+            for idx, fd in enumerate(fds):
+                if idx in self._held_slots:
+                    continue
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                self._held_slots.add(idx)
+                return idx
+            if time.monotonic() >= deadline:
+                self.timeouts += 1
+                raise AdmissionTimeout(f"{self.name} host slots timeout")
+            await asyncio.sleep(0.1)
+
+    def _release_host(self, idx: int) -> None:
+        fcntl.flock(self._slot_fds[idx], fcntl.LOCK_UN)
+        self._held_slots.discard(idx)
+
+    # --- Public API ---
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        on_wait: Callable[[int], Any] | None = None,
+        key: str = "",
+        weight: float = 1.0,
+        cost: float = 1.0,
+    ) -> AsyncIterator[None]:
+        """
+        Hold a backend slot for the duration of the context.
+
+        Arguments:
+            on_wait: Called with the 1-based queue position while waiting.
+            key: The fair-share key of the request, e.g. the user ID.
+            weight: The share weight of the key.
+            cost: The estimated cost of the request, e.g. in tokens.
+
+        Raises:
+            AdmissionRejected: If the wait queue is full.
+            AdmissionTimeout: If no slot is available within the timeout.
+        """
+        start = time.monotonic()
+        deadline = start + self.timeout
+        await self._acquire_local(deadline, on_wait, key, weight, cost)
+        host_slot = None
+        try:
+            if self.host_max_concurrent:
+                host_slot = await self._acquire_host(deadline)
+            waited = time.monotonic() - start
+            self.admitted += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            yield
+        finally:
+            if host_slot is not None:
+                self._release_host(host_slot)
+            self._release_local()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "host_max_concurrent": self.host_max_concurrent,
+            "active": self._active,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "wait_avg": self.wait_total / self.admitted if self.admitted else 0.0,
+            "wait_max": self.wait_max,
+        }
@@ -0,0 +1,154 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from .. import logger
+
+
+class CircuitOpen(Exception):
+    """Raised when a call is refused because its circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    A circuit breaker over a rolling window of calls to one dependency.
+
+    Calls failing, timing out or taking longer than half of `timeout` count
+    as failures. Once at least `min_calls` calls in the last `window` seconds
+    fail at `failure_ratio` or more, the circuit opens and calls are refused
+    at once with `CircuitOpen`. After `reset_timeout` seconds up to
+    `half_open_calls` probes are let through; a good probe closes the circuit,
+    a bad one opens it again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float = 30.0,
+        failure_ratio: float = 0.5,
+        min_calls: int = 5,
+        window: float = 60.0,
+        reset_timeout: float = 30.0,
+        half_open_calls: int = 1,
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.state = "closed"
+        self._calls: deque[tuple[float, bool, float]] = deque()
+        self._opened_at = 0.0
+        self._probes = 0
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def is_open(self) -> bool:
+        """Whether calls are refused right now."""
+        return (
+            self.state == "open"
+            and time.monotonic() - self._opened_at < self.reset_timeout
+        )
+
+    def _trim(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+
+    def _open(self, now: float) -> None:
+        self.state = "open"
+        self._opened_at = now
+        self._probes = 0
+        self._calls.clear()
+        self.opened += 1
+        logger.warning(f"Circuit {self.name} opened.")
+
+    def _acquire(self) -> None:
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                self.rejected += 1
+                raise CircuitOpen(f"{self.name} circuit is open")
+            self.state = "half_open"
+            self._probes = 0
+        if self.state == "half_open":
+            if self._probes >= self.half_open_calls:
+                self.rejected += 1
+                raise CircuitOpen(f"{self.name} circuit is half open")
+            self._probes += 1
+
+    def record(self, failed: bool, duration: float = 0.0) -> None:
+        """Record the outcome of a call made outside of `call`."""
+        now = time.monotonic()
+        if self.state == "half_open":
+            self._probes = max(0, self._probes - 1)
+            if failed:
+                self._open(now)
+            else:
+                self.state = "closed"
+                self._calls.clear()
+                logger.info(f"Circuit {self.name} closed.")
+            return
+        if self.state == "open":
+            return  # late outcome of a call started before opening
+
+        self._calls.append((now, failed, duration))
+        self._trim(now)
+        failures = sum(1 for _, f, _ in self._calls if f)
+        if (
+            len(self._calls) >= self.min_calls
+            and failures / len(self._calls) >= self.failure_ratio
+        ):
+            self._open(now)
+
+    def record_failure(self) -> None:
+        self.record(True)
+
+    async def call(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Await `factory()` under the breaker, bounded by `timeout` seconds.
+
+        Raises:
+            CircuitOpen: The circuit is open, the call is not made.
+            TimeoutError: The call took longer than `timeout`.
+        """
+        self._acquire()
+        start = time.monotonic()
+        try:
+            if self.timeout:
+                result = await asyncio.wait_for(factory(), self.timeout)
+            else:
+                result = await factory()
+        except asyncio.CancelledError:
+            # Not the dependency's fault, just give back the probe
+            if self.state == "half_open":
+                self._probes = max(0, self._probes - 1)
+            raise
+        except Exception:
+            self.record(True, time.monotonic() - start)
+            raise
+        duration = time.monotonic() - start
+        self.record(bool(self.timeout) and duration > self.timeout / 2, duration)
+        return result
+
+    def stats(self) -> dict[str, Any]:
+        self._trim(time.monotonic())
+        durations = sorted(d for _, _, d in self._calls)
+        failures = sum(1 for _, f, _ in self._calls if f)
+
+        def percentile(p: float) -> float:
+            if not durations:
+                return 0.0
+            return durations[min(len(durations) - 1, int(len(durations) * p))]
+
+        return {
+            "state": "open" if self.is_open else self.state,
+            "calls": len(durations),
+            "failure_ratio": failures / len(durations) if durations else 0.0,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,146 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable
+
+from .. import logger
+
+
+class StreamJob:
+    """
+    The buffered text output of a server-side job.
+
+    The job appends to `content` as it goes, any number of readers follow it
+    with `follow` from their own offset, and may come and go while it runs.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.content = ""
+        self.notice: str | None = None  # transient state, e.g. queue position
+        self.error: tuple[str, str] | None = None  # (notify type, message)
+        self.status = "running"
+        self.started = time.monotonic()
+        self.finished: float | None = None
+        self.finished_ts: datetime | None = None
+        self.task: asyncio.Task | None = None
+        self.stopped = False  # cancelled by `cancel`, not e.g. at shutdown
+        self._wake = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status != "running"
+
+    def _changed(self) -> None:
+        self._wake.set()
+        self._wake = asyncio.Event()
+
+    def append(self, text: str) -> None:
+        if text:
+            self.content += text
+            self._changed()
+
+    def set_notice(self, notice: str | None) -> None:
+        self.notice = notice
+        self._changed()
+
+    def finish(self, status: str) -> None:
+        if self.done:
+            return
+        self.status = status
+        self.notice = None
+        self.finished = time.monotonic()
+        self.finished_ts = datetime.now()
+        self._changed()
+
+    def cancel(self) -> None:
+        """Stop the job, its task sees the cancellation with `stopped` set."""
+        if self.task is not None and not self.task.done():
+            self.stopped = True
+            self.task.cancel()
+
+    async def follow(self, offset: int = 0) -> AsyncIterator[str]:
+        """
+        Yield the content from `offset` on, then every change until the job is
+        done. The yielded text may be empty when only the notice changed.
+        """
+        while True:
+            # Take the event before reading, so no change can slip in between
+            wake = self._wake
+            delta = self.content[offset:]
+            offset += len(delta)
+            yield delta
+            if self.done and offset >= len(self.content):
+                return
+            await wake.wait()
+
+    async def wait(self) -> str:
+        """Wait for the job to finish and return its status."""
+        while not self.done:
+            await self._wake.wait()
+        return self.status
+
+
+class JobRegistry:
+    """
+    Runs `StreamJob`s as tasks detached from any client, and keeps finished
+    jobs for `linger` seconds so late readers can still pick up the result.
+    """
+
+    def __init__(self, linger: float = 300.0):
+        self.linger = linger
+        self._jobs: dict[str, StreamJob] = {}
+        self.started = 0
+        self.failed = 0
+
+    def start(
+        self,
+        key: str,
+        run: Callable[[StreamJob], Awaitable[str]],
+    ) -> StreamJob:
+        """
+        Start `run(job)` in background, the status it returns finishes the job.
+        """
+        self._prune()
+        job = StreamJob(key)
+
+        async def runner():
+            status = "aborted"
+            try:
+                status = await run(job)
+            except asyncio.CancelledError:
+                logger.info(f"Job {key} cancelled.")
+                if not job.stopped:
+                    raise
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Job {key} failed: {e!r}")
+            finally:
+                job.finish(status)
+
+        job.task = asyncio.create_task(runner())
+        self._jobs[key] = job
+        self.started += 1
+        return job
+
+    def get(self, key: str) -> StreamJob | None:
+        self._prune()
+        return self._jobs.get(key)
+
+    def _prune(self) -> None:
+        now = time.monotonic()
+        for key in [
+            k
+            for k, j in self._jobs.items()
+            if j.finished is not None and now - j.finished > self.linger
+        ]:
+            del self._jobs[key]
+
+    def stats(self) -> dict:
+        running = sum(1 for j in self._jobs.values() if not j.done)
+        return {
+            "running": running,
+            "lingering": len(self._jobs) - running,
+            "started": self.started,
+            "failed": self.failed,
+        }
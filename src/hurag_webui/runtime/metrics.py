@@ -0,0 +1,24 @@
+from typing import Any, Callable
+
+_providers: dict[str, Callable[[], dict[str, Any]]] = {}
+
+
+def register_metrics(name: str, provider: Callable[[], dict[str, Any]]) -> None:
+    """
+    Register a metrics provider under the given name.
+
+    Arguments:
+        name: The name of the metrics group, e.g. "retrieval_cache".
+        provider: A callable returning a JSON-serializable dict of metrics.
+    """
+    _providers[name] = provider
+
+
+def collect_metrics() -> dict[str, dict[str, Any]]:
+    """
+    Collect a snapshot of all registered metrics of this worker process.
+
+    Returns:
+        A dictionary mapping metrics group names to their metrics.
+    """
+    return {name: provider() for name, provider in _providers.items()}
@@ -0,0 +1,121 @@
+import time
+from typing import Any
+
+
+class QuotaExceeded(RuntimeError):
+    """The token budget is used up for longer than acceptable."""
+
+
+class TokenBucket:
+    """A token bucket refilled at `rate` tokens per second up to `capacity`."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def consume(self, tokens: float) -> None:
+        """Consume tokens, the balance may go negative as a debt."""
+        self._refill()
+        self.tokens -= tokens
+
+    def delay(self) -> float:
+        """Seconds until the balance is no longer negative."""
+        self._refill()
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate if self.rate > 0 else float("inf")
+
+
+class QuotaManager:
+    """
+    Per-user token accounting with token-bucket budgets.
+
+    A request may start whenever its user is not in debt; its actual token
+    usage is charged afterwards, so heavy users are delayed until their
+    bucket recovers. Budgets are given in tokens per minute, by default or
+    overridden for an account or a user_path prefix, and the ratio of a
+    user's budget to the default also serves as the fair-share weight.
+    """
+
+    def __init__(
+        self,
+        tokens_per_minute: float,
+        burst: float,
+        scope: str = "user",
+        overrides: dict[str, float] | None = None,
+    ):
+        self.tokens_per_minute = tokens_per_minute
+        self.burst = burst or tokens_per_minute
+        self.scope = scope
+        self.overrides = overrides or {}
+        self._buckets: dict[str, TokenBucket] = {}
+        self.usage: dict[str, int] = {}
+        self.throttled = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.tokens_per_minute > 0
+
+    def _budget(self, account: str, user_path: str) -> float:
+        if account in self.overrides:
+            return self.overrides[account]
+        prefixes = [p for p in self.overrides if user_path.startswith(p)]
+        if prefixes:
+            return self.overrides[max(prefixes, key=len)]
+        return self.tokens_per_minute
+
+    def identify(self, account: str, user_path: str) -> tuple[str, float]:
+        """
+        Get the accounting key and the fair-share weight of a user.
+
+        Arguments:
+            account: The user account.
+            user_path: The user path.
+
+        Returns:
+            A tuple of the key and the weight.
+        """
+        key = user_path if self.scope == "user_path" else account
+        if not self.enabled:
+            return key, 1.0
+        budget = self._budget(account, user_path)
+        if key not in self._buckets:
+            per_second = budget / 60
+            capacity = self.burst * budget / self.tokens_per_minute
+            self._buckets[key] = TokenBucket(per_second, capacity)
+        return key, budget / self.tokens_per_minute
+
+    def delay(self, key: str) -> float:
+        """Seconds the user has to wait before the next request."""
+        bucket = self._buckets.get(key)
+        wait = bucket.delay() if bucket else 0.0
+        if wait > 0:
+            self.throttled += 1
+        return wait
+
+    def charge(self, key: str, tokens: int) -> None:
+        """Charge the tokens used by a request."""
+        self.usage[key] = self.usage.get(key, 0) + tokens
+        bucket = self._buckets.get(key)
+        if bucket:
+            bucket.consume(tokens)
+
+    def stats(self) -> dict[str, Any]:
+        top = sorted(self.usage.items(), key=lambda x: x[1], reverse=True)[:10]
+        return {
+            "tokens_per_minute": self.tokens_per_minute,
+            "users": len(self.usage),
+            "tokens_total": sum(self.usage.values()),
+            "throttled": self.throttled,
+            "in_debt": sum(1 for b in self._buckets.values() if b.tokens < 0),
+            "top_users": dict(top),
+        }
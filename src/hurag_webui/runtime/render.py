@@ -0,0 +1,80 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class RenderPool:
+    """
+    A small thread pool for CPU-heavy rendering, awaited from the event loop.
+
+    At most `max_queue` calls are pending at once, further callers wait for
+    their turn before submitting, so a burst of rendering cannot pile up
+    unbounded work. The executor is created on first use in each process, so
+    the pool can be created before workers are forked.
+    """
+
+    def __init__(self, name: str, workers: int = 2, max_queue: int = 64):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: ThreadPoolExecutor | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._pid: int | None = None
+        self.calls = 0
+        self.pending = 0
+        self.wait_total = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    def _ensure(self) -> tuple[ThreadPoolExecutor, asyncio.Semaphore]:
+        if self._pid != os.getpid():
+            # The threads of an executor do not survive a fork
+            self._executor, self._slots, self._pid = None, None, os.getpid()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix=f"{self.name}-render",
+            )
+            self._slots = asyncio.Semaphore(self.max_queue)
+        return self._executor, self._slots
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run `fn(*args)` in the pool and return its result."""
+        executor, slots = self._ensure()
+        queued = time.monotonic()
+        self.pending += 1
+        try:
+            async with slots:
+                started = time.monotonic()
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(
+                        executor, fn, *args
+                    )
+                finally:
+                    elapsed = time.monotonic() - started
+                    self.calls += 1
+                    self.wait_total += started - queued
+                    self.run_total += elapsed
+                    self.run_max = max(self.run_max, elapsed)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._slots = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self.pending,
+            "calls": self.calls,
+            "wait_avg": self.wait_total / self.calls if self.calls else 0.0,
+            "run_avg": self.run_total / self.calls if self.calls else 0.0,
+            "run_max": self.run_max,
+        }
+
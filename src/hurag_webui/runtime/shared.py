@@ -0,0 +1,267 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Iterable
+
+from .. import logger
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    ts REAL NOT NULL
+);
+"""
+_PURGE_EVERY = 120  # polls between purges of expired values and old events
+
+
+class SharedState:
+    """
+    Host-local state shared by the worker processes, in a SQLite database in
+    WAL mode, so no external service is needed.
+
+    Values are JSON, kept under a namespace and a key until they expire.
+    Events published on a topic reach the subscribers of this process at once,
+    and those of the other processes when they poll for new events, every
+    `poll_interval` seconds while started. Events older than `event_ttl`
+    seconds are purged.
+
+    The database is opened on first use in each process, so the object can be
+    created before workers are forked.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: str | None = None,
+        poll_interval: float = 0.5,
+        event_ttl: float = 60,
+    ):
+        self.name = name
+        self.path = path or os.path.join(
+            tempfile.gettempdir(), f"hurag_webui-{name}.db"
+        )
+        self.poll_interval = poll_interval
+        self.event_ttl = event_ttl
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._pid: int | None = None
+        self._last_seq = 0
+        self._subscribers: dict[str, list[Callable[[Any], Any]]] = {}
+        self._poller: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    # --- Database ---
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=5, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            return fn(self._connect())
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        if self._pid != os.getpid():
+            # First use in this process, connections do not survive a fork
+            self._conn, self._lock, self._pid = None, threading.Lock(), os.getpid()
+        return await asyncio.to_thread(self._execute, fn)
+
+    # --- Values ---
+
+    async def get(self, ns: str, key: str) -> Any:
+        """The value of `key` in namespace `ns`, None if missing or expired."""
+        return (await self.get_many(ns, [key])).get(key)
+
+    async def get_many(self, ns: str, keys: Iterable[str]) -> dict[str, Any]:
+        """The values found of the given keys in namespace `ns`, by key."""
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        def fetch(conn: sqlite3.Connection) -> list[tuple[str, str]]:
+            marks = ",".join("?" * len(keys))
+            return conn.execute(
+                f"SELECT key, value FROM kv WHERE ns = ? AND key IN ({marks}) "
+                "AND expires >= ?",
+                (ns, *keys, time.time()),
+            ).fetchall()
+
+        try:
+            rows = await self._run(fetch)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Shared state {self.name} read failed: {e!r}")
+            rows = []
+        self.hits += len(rows)
+        self.misses += len(keys) - len(rows)
+        return {key: json.loads(value) for key, value in rows}
+
+    async def set(self, ns: str, key: str, value: Any, ttl: float) -> None:
+        """Set the value of `key` in namespace `ns` for `ttl` seconds."""
+        await self.set_many(ns, {key: value}, ttl)
+
+    async def set_many(self, ns: str, items: dict[str, Any], ttl: float) -> None:
+        """Set the values of several keys in namespace `ns` for `ttl` seconds."""
+        if not items or ttl <= 0:
+            return
+        expires = time.time() + ttl
+        rows = [(ns, key, json.dumps(value), expires) for key, value in items.items()]
+        try:
+            await self._run(
+                lambda conn: conn.executemany(
+                    "INSERT OR REPLACE INTO kv (ns, key, value, expires) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+            )
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Shared state {self.name} write failed: {e!r}")
+
+    async def delete(self, ns: str, key: str) -> None:
+        """Remove `key` from namespace `ns`."""
+        try:
+            await self._run(
+                lambda conn: conn.execute(
+                    "DELETE FROM kv WHERE ns = ? AND key = ?", (ns, key)
+                )
+            )
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Shared state {self.name} write failed: {e!r}")
+
+    # --- Events ---
+
+    def subscribe(
+        self, topic: str, callback: Callable[[Any], Any]
+    ) -> Callable[[], None]:
+        """
+        Call `callback(payload)` for the events published on `topic`.
+
+        Arguments:
+            topic: The topic to subscribe to.
+            callback: A function or coroutine function taking the payload.
+
+        Returns:
+            A function removing the subscription.
+        """
+        self._subscribers.setdefault(topic, []).append(callback)
+
+        def unsubscribe() -> None:
+            callbacks = self._subscribers.get(topic)
+            if callbacks and callback in callbacks:
+                callbacks.remove(callback)
+                if not callbacks:
+                    del self._subscribers[topic]
+
+        return unsubscribe
+
+    async def publish(self, topic: str, payload: Any = None) -> None:
+        """Publish an event to the subscribers of all processes on the host."""
+        self.published += 1
+        self._dispatch(topic, payload)
+        data = json.dumps(payload)
+        try:
+            await self._run(
+                lambda conn: conn.execute(
+                    "INSERT INTO events (topic, payload, pid, ts) VALUES (?, ?, ?, ?)",
+                    (topic, data, os.getpid(), time.time()),
+                )
+            )
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning(f"Shared state {self.name} publish failed: {e!r}")
+
+    def _dispatch(self, topic: str, payload: Any) -> None:
+        for callback in list(self._subscribers.get(topic, ())):
+            try:
+                result = callback(payload)
+                if asyncio.iscoroutine(result):
+                    asyncio.create_task(result)
+            except Exception as e:
+                logger.warning(f"Shared state {self.name} subscriber error: {e!r}")
+
+    def _fetch_events(self, conn: sqlite3.Connection) -> list[tuple]:
+        return conn.execute(
+            "SELECT seq, topic, payload, pid FROM events WHERE seq > ? ORDER BY seq",
+            (self._last_seq,),
+        ).fetchall()
+
+    def _purge(self, conn: sqlite3.Connection) -> None:
+        now = time.time()
+        conn.execute("DELETE FROM kv WHERE expires < ?", (now,))
+        conn.execute("DELETE FROM events WHERE ts < ?", (now - self.event_ttl,))
+
+    async def _poll(self) -> None:
+        polls = 0
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            polls += 1
+            try:
+                if polls % _PURGE_EVERY == 0:
+                    await self._run(self._purge)
+                rows = await self._run(self._fetch_events)
+            except sqlite3.Error as e:
+                self.errors += 1
+                logger.warning(f"Shared state {self.name} poll failed: {e!r}")
+                continue
+            for seq, topic, payload, pid in rows:
+                self._last_seq = max(self._last_seq, seq)
+                if pid == os.getpid():
+                    continue  # dispatched when published
+                self.received += 1
+                self._dispatch(topic, json.loads(payload))
+
+    async def start(self) -> None:
+        """Start polling for the events of other processes, from now on."""
+        if self._poller is not None:
+            return
+        self._last_seq = await self._run(
+            lambda conn: conn.execute("SELECT COALESCE(MAX(seq), 0) FROM events")
+            .fetchone()[0]
+        )
+        self._poller = asyncio.create_task(self._poll())
+
+    async def stop(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+            self._conn = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "published": self.published,
+            "received": self.received,
+            "subscribers": sum(len(c) for c in self._subscribers.values()),
+            "errors": self.errors,
+        }
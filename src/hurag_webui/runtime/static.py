@@ -0,0 +1,177 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Any
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import PlainTextResponse, Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+_IMMUTABLE = "public, max-age=31536000, immutable"
+_REVALIDATE = "no-cache"
+
+
+class _Asset:
+    """A static file held in memory, with its compressed variants."""
+
+    __slots__ = ("body", "media_type", "digest", "variants")
+
+    def __init__(self, body: bytes, media_type: str, digest: str):
+        self.body = body
+        self.media_type = media_type
+        self.digest = digest
+        self.variants: dict[str, bytes] = {}  # content-coding -> body
+
+    def etag(self, coding: str | None) -> str:
+        """The strong ETag of the body in the given content-coding."""
+        return f'"{self.digest}-{coding}"' if coding else f'"{self.digest}"'
+
+
+def _accepted(accept_encoding: str) -> set[str]:
+    """The content codings accepted by an Accept-Encoding header."""
+    codings = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        if coding:
+            codings.add(coding.strip().lower())
+    return codings
+
+
+def _entity_tags(if_none_match: str) -> set[str]:
+    """The entity tags of an If-None-Match header, weak ones as strong."""
+    return {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+
+class PrecompressedStatic:
+    """
+    An ASGI app serving the files of a directory from memory.
+
+    The files are read once, with gzip (and brotli, if installed) variants
+    built when they shrink by at least `min_ratio`, and served by content
+    negotiation with a strong ETag per content-coding. Each file is also
+    served under a content hashed name from `url`, cached by browsers as
+    immutable, while the plain name is revalidated with its ETag.
+    """
+
+    def __init__(self, directory: str, min_size: int = 256, min_ratio: float = 0.1):
+        self.directory = directory
+        self.min_size = min_size
+        self.min_ratio = min_ratio
+        self._assets: dict[str, tuple[_Asset, str]] = {}  # (asset, cache-control)
+        self._hashed: dict[str, str] = {}  # name -> hashed name
+        self.requests = 0
+        self.not_modified = 0
+        self.compressed = 0
+        self._load()
+
+    def _load(self) -> None:
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                path = os.path.join(root, file)
+                name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    body = f.read()
+                digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+                asset = _Asset(
+                    body,
+                    mimetypes.guess_type(file)[0] or "application/octet-stream",
+                    digest,
+                )
+                if len(body) >= self.min_size:
+                    self._compress(asset)
+                stem, ext = os.path.splitext(name)
+                hashed = f"{stem}.{digest}{ext}"
+                self._assets[name] = (asset, _REVALIDATE)
+                self._assets[hashed] = (asset, _IMMUTABLE)
+                self._hashed[name] = hashed
+
+    def _compress(self, asset: _Asset) -> None:
+        limit = len(asset.body) * (1 - self.min_ratio)
+        candidates = {"gzip": gzip.compress(asset.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            candidates["br"] = brotli.compress(asset.body, quality=11)
+        for coding, body in candidates.items():
+            if len(body) <= limit:
+                asset.variants[coding] = body
+
+    def url(self, name: str, prefix: str = "/static") -> str:
+        """The content hashed URL of a file, cacheable forever."""
+        return f"{prefix}/{self._hashed[name]}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        assert scope["type"] == "http"
+        response = self._respond(scope)
+        await response(scope, receive, send)
+
+    def _respond(self, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            return PlainTextResponse("Method Not Allowed", status_code=405)
+        path, root = scope["path"], scope.get("root_path", "")
+        if root and path.startswith(root):
+            path = path[len(root) :]
+        found = self._assets.get(path.lstrip("/"))
+        if found is None:
+            return PlainTextResponse("Not Found", status_code=404)
+
+        asset, cache_control = found
+        self.requests += 1
+        headers = Headers(scope=scope)
+        accepted = _accepted(headers.get("accept-encoding", ""))
+        coding = next(
+            (c for c in ("br", "gzip") if c in asset.variants and c in accepted),
+            None,
+        )
+        etag = asset.etag(coding)
+        response_headers = {
+            "ETag": etag,
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        tags = _entity_tags(headers.get("if-none-match", ""))
+        if etag in tags or "*" in tags:
+            self.not_modified += 1
+            return Response(status_code=304, headers=response_headers)
+
+        body = asset.body
+        if coding is not None:
+            body = asset.variants[coding]
+            response_headers["Content-Encoding"] = coding
+            self.compressed += 1
+        return Response(body, headers=response_headers, media_type=asset.media_type)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "files": len(self._hashed),
+            "requests": self.requests,
+            "not_modified": self.not_modified,
+            "compressed": self.compressed,
+        }
+
+
+class SelectiveGZipMiddleware:
+    """
+    `GZipMiddleware` for the paths not starting with one of `exclude`, e.g.
+    those of a `PrecompressedStatic` that picks the content-coding and its
+    ETag itself.
+    """
+
+    def __init__(self, app: ASGIApp, exclude: tuple[str, ...] = (), **kwargs: Any):
+        self.app = app
+        self.exclude = exclude
+        self._gzip = GZipMiddleware(app, **kwargs)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(self.exclude):
+            await self.app(scope, receive, send)
+        else:
+            await self._gzip(scope, receive, send)
@@ -1,5 +1,6 @@
 from .citation_service import (
     load_citations_by_ids,
+    load_knowledge_by_message,
 )
 from .user_service import (
     get_user,
@@ -14,9 +15,21 @@ from .session_service import (
     load_session_by_id,
     load_sessions_by_user,
     upsert_session,
+    insert_response_variant,
+    load_response_mode,
+    checkpoint_response,
+    finish_response,
+    save_formatted_messages,
+    load_formatted_messages,
     load_messages_by_session,
     load_citation_ids_by_session,
+    load_citation_ids_by_message,
+    load_message_contents,
+    remember_message_contents,
     generate_session_title,
+    summarize_history,
+    load_session_summary,
+    update_session_summary,
     like_message,
     dislike_message,
     update_session_title,
@@ -25,9 +38,35 @@ from .session_service import (
     next_session_batch,
     search_result_batch,
 )
+from .retrieval_service import (
+    normalize_query,
+    retrieve_knowledge,
+    select_mode,
+    dedup_knowledge,
+)
+from .llm_service import (
+    llm_admission,
+    llm_quota,
+    llm_breaker,
+    retrieval_breaker,
+    knowledge_breaker,
+)
+from .generation_service import (
+    generation_jobs,
+    generate_response,
+)
+from .answer_service import (
+    lookup_answer,
+    store_answer,
+)
+from .shared_service import (
+    shared_state,
+    sessions_topic,
+)
 
 __all__ = [
     "load_citations_by_ids",
+    "load_knowledge_by_message",
     "get_user",
     "get_user_by_id",
     "is_account_exist",
@@ -38,9 +77,21 @@ __all__ = [
     "load_session_by_id",
     "load_sessions_by_user",
     "upsert_session",
+    "insert_response_variant",
+    "load_response_mode",
+    "checkpoint_response",
+    "finish_response",
+    "save_formatted_messages",
+    "load_formatted_messages",
     "load_messages_by_session",
     "load_citation_ids_by_session",
+    "load_citation_ids_by_message",
+    "load_message_contents",
+    "remember_message_contents",
     "generate_session_title",
+    "summarize_history",
+    "load_session_summary",
+    "update_session_summary",
     "like_message",
     "dislike_message",
     "update_session_title",
@@ -48,4 +99,19 @@ __all__ = [
     "pin_session_by_id",
     "next_session_batch",
     "search_result_batch",
+    "normalize_query",
+    "retrieve_knowledge",
+    "select_mode",
+    "dedup_knowledge",
+    "llm_admission",
+    "llm_quota",
+    "llm_breaker",
+    "retrieval_breaker",
+    "knowledge_breaker",
+    "generation_jobs",
+    "generate_response",
+    "lookup_answer",
+    "store_answer",
+    "shared_state",
+    "sessions_topic",
 ]
@@ -0,0 +1,153 @@
+from __future__ import annotations
+from typing import Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from hurag.schemas import Knowledge
+
+from .. import conf, logger
+from ..runtime import TTLCache, register_metrics
+from .llm_service import knowledge_breaker
+from .retrieval_service import normalize_query
+from .shared_service import shared_state
+
+import hashlib
+
+_answer_cache = TTLCache(
+    maxsize=conf.cache.answer_size,
+    ttl=conf.cache.answer_ttl,
+)
+# {(user_path, mode): {normalized_query: bigrams, ...}, ...} for near matches
+_scopes: dict[tuple[str, str], dict[str, frozenset[str]]] = {}
+_answer_stats = {"near_hits": 0, "invalidated": 0, "stored": 0}
+register_metrics("answer_cache", lambda: _answer_cache.stats() | _answer_stats)
+
+
+def _fingerprint(content: str | None) -> str:
+    return hashlib.blake2b((content or "").encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _shared_key(scope: tuple[str, str], normalized: str) -> str:
+    return "\x1f".join((*scope, normalized))
+
+
+def _bigrams(text: str) -> frozenset[str]:
+    text = text.replace(" ", "")
+    return frozenset(text[i : i + 2] for i in range(max(1, len(text) - 1)))
+
+
+def _find_near_match(scope: tuple[str, str], query: str) -> str | None:
+    threshold = conf.cache.answer_similarity
+    entries = _scopes.get(scope)
+    if not threshold or not entries:
+        return None
+    grams = _bigrams(query)
+    best, best_sim = None, threshold
+    for other, other_grams in list(entries.items()):
+        if (*scope, other) not in _answer_cache:
+            del entries[other]  # expired or evicted
+            continue
+        sim = len(grams & other_grams) / len(grams | other_grams)
+        if sim >= best_sim:
+            best, best_sim = other, sim
+    return best
+
+
+async def lookup_answer(
+    query: str,
+    mode: str,
+    user_path: str,
+) -> tuple[str, list[tuple[Knowledge, float]]] | None:
+    """
+    Look up a cached answer of the same, or a similar, question.
+
+    The cited segments are reloaded and compared with the fingerprints taken
+    when the answer was stored, the entry is invalidated if any has changed.
+
+    Arguments:
+        query: The user query.
+        mode: The RAG mode.
+        user_path: The user path restricting the knowledge scope.
+
+    Returns:
+        A tuple of the cached answer and its cited (Knowledge, score) list, or
+        None if there is no valid cached answer.
+    """
+    scope = (user_path, mode)
+    normalized = normalize_query(query)
+    entry = _answer_cache.get((*scope, normalized))
+    if entry is None:
+        # Stored by another worker
+        entry = await shared_state.get("answer", _shared_key(scope, normalized))
+        if entry is not None:
+            _answer_cache.set((*scope, normalized), entry)
+    if entry is None:
+        normalized = _find_near_match(scope, normalized)
+        if normalized is None:
+            return None
+        entry = _answer_cache.get((*scope, normalized))
+        if entry is None:
+            return None
+        _answer_stats["near_hits"] += 1
+
+    knowledge_list = []
+    if entry["segments"]:
+        from hurag.knowledge_base import get_knowledge_by_segment_ids
+
+        try:
+            kns = await knowledge_breaker.call(
+                lambda: get_knowledge_by_segment_ids(
+                    list(entry["segments"]), user_path
+                )
+            )
+        except Exception as e:
+            # Cannot verify the cited segments, answer it afresh, a cache
+            # lookup never fails the request
+            logger.warning(f"Cached answer not verified: {e!r}")
+            return None
+        kn_map = {k.segment_id: k for k in kns}
+        for sid, (fingerprint, score) in entry["segments"].items():
+            knowledge = kn_map.get(sid)
+            if knowledge is None or _fingerprint(knowledge.content) != fingerprint:
+                logger.info(f"Cached answer invalidated, segment {sid} changed.")
+                _answer_cache.pop((*scope, normalized))
+                await shared_state.delete("answer", _shared_key(scope, normalized))
+                _answer_stats["invalidated"] += 1
+                return None
+            knowledge_list.append((knowledge, score))
+
+    return entry["response"], knowledge_list
+
+
+async def store_answer(
+    query: str,
+    mode: str,
+    user_path: str,
+    response: str,
+    knowledge_list: list[tuple[Knowledge, float]],
+) -> None:
+    """
+    Store a completed answer with fingerprints of the segments it cites.
+
+    Arguments:
+        query: The user query.
+        mode: The RAG mode.
+        user_path: The user path restricting the knowledge scope.
+        response: The complete LLM response.
+        knowledge_list: The cited (Knowledge, score) list.
+    """
+    scope = (user_path, mode)
+    normalized = normalize_query(query)
+    entry: dict[str, Any] = {
+        "response": response,
+        "segments": {
+            k.segment_id: (_fingerprint(k.content), score)
+            for k, score in knowledge_list
+        },
+    }
+    _answer_cache.set((*scope, normalized), entry)
+    await shared_state.set(
+        "answer", _shared_key(scope, normalized), entry, conf.cache.answer_ttl
+    )
+    _answer_stats["stored"] += 1
+    if conf.cache.answer_similarity:
+        _scopes.setdefault(scope, {})[normalized] = _bigrams(normalized)
@@ -1,5 +1,14 @@
-from typing import Sequence
+from __future__ import annotations
+from typing import Sequence, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from hurag.schemas import Knowledge
+
+from .. import conf, db_pool_name, logger
 from ..models import Citation
+from ..runtime import CircuitOpen
+from .llm_service import knowledge_breaker
+from .shared_service import shared_state
 
 
 async def load_citations_by_ids(
@@ -24,14 +33,76 @@ async def load_citations_by_ids(
     if not uncached_ids:
         return citations
 
+    # Load citations cached by other workers
+    shared = await shared_state.get_many("citation", uncached_ids)
+    for cid, data in shared.items():
+        citations.append(Citation.model_validate(data))
+        cached_citations[cid] = data
+    uncached_ids -= shared.keys()
+    if not uncached_ids:
+        return citations
+
     # Load uncached citations from HuRAG SDK
     from hurag.knowledge_base import get_knowledge_by_segment_ids
 
-    kns = await get_knowledge_by_segment_ids(list(uncached_ids), user_path)
+    try:
+        kns = await knowledge_breaker.call(
+            lambda: get_knowledge_by_segment_ids(list(uncached_ids), user_path)
+        )
+    except (CircuitOpen, TimeoutError) as e:
+        logger.warning(f"Loading citations failed: {e!r}")
+        return citations
+    loaded = {}
     for knowledge in kns:
         citation = Citation().from_knowledge(knowledge)
         citations.append(citation)
         # Update cached citations
-        cached_citations[citation.id] = citation.model_dump()
+        loaded[citation.id] = citation.model_dump(mode="json")
+    cached_citations.update(loaded)
+    await shared_state.set_many("citation", loaded, conf.shared.cache_ttl)
 
     return citations
+
+
+async def load_knowledge_by_message(
+    message_id: str,
+    user_path: str,
+) -> list[tuple[Knowledge, float]]:
+    """Load the knowledge segments cited by a response, with their scores.
+
+    Args:
+        message_id (str): ID of the response message.
+        user_path (str): The user path for API requests.
+
+    Returns:
+        list[tuple[Knowledge, float]]: (Knowledge, score) tuples in the
+            original order, segments no longer available are skipped.
+    """
+    from hurag.dss import rss
+
+    rows = await rss.query(
+        """
+        SELECT segment_id, score FROM query_segments
+        WHERE query_id = %s ORDER BY seq_no ASC
+        """,
+        (message_id,),
+        pool_name=db_pool_name,
+    )
+    if not rows:
+        return []
+
+    from hurag.knowledge_base import get_knowledge_by_segment_ids
+
+    try:
+        kns = await knowledge_breaker.call(
+            lambda: get_knowledge_by_segment_ids([r[0] for r in rows], user_path)
+        )
+    except (CircuitOpen, TimeoutError) as e:
+        logger.warning(f"Loading knowledge of message {message_id} failed: {e!r}")
+        return []
+    kn_map = {k.segment_id: k for k in kns}
+    return [
+        (kn_map[sid], score if score is not None else 0.0)
+        for sid, score in rows
+        if sid in kn_map
+    ]
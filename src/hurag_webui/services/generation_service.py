@@ -0,0 +1,225 @@
+from __future__ import annotations
+from typing import Any, Awaitable, Callable, Literal, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from hurag.schemas import Knowledge
+    from openai import AsyncOpenAI
+
+from .. import logger, conf, oa_client_name, oa_model_name
+from ..runtime import (
+    JobRegistry,
+    StreamJob,
+    register_metrics,
+    AdmissionRejected,
+    AdmissionTimeout,
+    CircuitOpen,
+    QuotaExceeded,
+)
+from .llm_service import llm_admission, llm_quota, llm_breaker
+from hurag.llm import with_oa_client, chat, extract_chunk
+
+import asyncio
+import time
+
+_EXPECTED_COMPLETION_TOKENS = 512  # completion cost estimate for fair sharing
+
+# Generation jobs of this worker, keyed by the ID of the response
+generation_jobs = JobRegistry(linger=conf.llm.job_linger)
+register_metrics("generation_jobs", generation_jobs.stats)
+
+_prompt_stats = {
+    "requests": 0,
+    "prompt_tokens_total": 0,
+    "prompt_tokens_max": 0,
+    "prompt_tokens_last": 0,
+}
+register_metrics(
+    "prompt",
+    lambda: {
+        **_prompt_stats,
+        "budget": conf.services.ctx_tokens - conf.services.max_tokens,
+        "prompt_tokens_avg": (
+            _prompt_stats["prompt_tokens_total"] / _prompt_stats["requests"]
+            if _prompt_stats["requests"]
+            else 0
+        ),
+    },
+)
+
+
+@with_oa_client(client_name=oa_client_name)
+async def generate_response(
+    job: StreamJob,
+    mode: Literal["naive", "mix", "community", "global"] | None,
+    message: str,
+    knowledge_list: list[tuple[Knowledge, float]],
+    system_prompt: str | None = None,
+    history: list | None = None,
+    temperature: float | None = 0,
+    timeout: int = 180,
+    account: str = "Guest",
+    user_path: str = "",
+    on_checkpoint: Callable[[str], Awaitable[Any]] | None = None,
+    oaclient: AsyncOpenAI | None = None,
+) -> Literal["complete", "aborted"]:
+    """
+    Stream the response of the backend LLM into a generation job.
+
+    Cancelling the task running this coroutine stops the generation and
+    closes the upstream stream, the partial response stays in the job.
+
+    Arguments:
+        job: The job to stream the response into.
+        mode: The chat mode.
+        message: The user message used to create the prompt.
+        knowledge_list: The list of knowledge items to use.
+        system_prompt: The system prompt.
+        history: The chat history.
+        temperature: The temperature for the LLM.
+        timeout: The timeout for the backend request.
+        account: The user account, for token accounting and fair sharing.
+        user_path: The user path, for token accounting and fair sharing.
+        on_checkpoint: Called with the partial response every
+            `history.checkpoint_interval` seconds while streaming.
+        oaclient: Placeholder for injecting an OpenAI client.
+
+    Returns:
+        The status of the response, "aborted" if it is cut by an error.
+    """
+    from httpx import RemoteProtocolError
+
+    from ..prompts import pack_prompt, count_tokens
+
+    status = "complete"
+    budget = conf.services.ctx_tokens - conf.services.max_tokens
+    prompt, history, prompt_tokens = pack_prompt(
+        query=message,
+        knowledge_list=knowledge_list if mode else None,
+        history=history or [],
+        budget=budget,
+        system_prompt=system_prompt,
+    )
+    _prompt_stats["requests"] += 1
+    _prompt_stats["prompt_tokens_total"] += prompt_tokens
+    _prompt_stats["prompt_tokens_last"] = prompt_tokens
+    _prompt_stats["prompt_tokens_max"] = max(
+        _prompt_stats["prompt_tokens_max"], prompt_tokens
+    )
+    logger.info(
+        f"Prompt tokens: {prompt_tokens}/{budget}, "
+        f"{len(history)} history messages, mode: {mode}"
+    )
+
+    async def checkpoint(partial: str):
+        try:
+            await on_checkpoint(partial)
+        except Exception as e:
+            logger.warning(f"Response checkpoint failed: {e!r}")
+
+    def show_queue_position(position: int):
+        job.set_notice(f"排队中，您前面还有 {position - 1} 个请求……")
+
+    quota_key, weight = llm_quota.identify(account, user_path)
+    usage = None
+    response = None
+    checkpoint_task = None
+    last_checkpoint = time.monotonic()
+    try:
+        # Do not queue up for a backend known to be failing
+        if llm_breaker.is_open:
+            raise CircuitOpen("llm circuit is open")
+        # Heavy users wait for their token budget to recover
+        delay = llm_quota.delay(quota_key)
+        if delay > conf.quota.max_delay:
+            raise QuotaExceeded(f"{quota_key} needs to wait {delay:.0f}s")
+        if delay > 0:
+            job.set_notice(f"您近期的使用量较大，请稍候 {delay:.0f} 秒……")
+            await asyncio.sleep(delay)
+        async with llm_admission.slot(
+            on_wait=show_queue_position,
+            key=quota_key,
+            weight=weight,
+            cost=prompt_tokens + _EXPECTED_COMPLETION_TOKENS,
+        ):
+            job.set_notice(None)
+            response = await llm_breaker.call(
+                lambda: chat(
+                    model=oa_model_name,
+                    prompt=prompt,
+                    system_prompt=system_prompt,
+                    history_messages=history,
+                    client=oaclient,
+                    temperature=temperature,
+                    stream=True,
+                    timeout=timeout,
+                )
+            )
+            async for chunk in response:
+                usage = getattr(chunk, "usage", None) or usage
+                if not getattr(chunk, "choices", True):
+                    continue  # the usage-only chunk at the end
+                job.append(extract_chunk(chunk))
+                if (
+                    on_checkpoint
+                    and time.monotonic() - last_checkpoint
+                    >= conf.history.checkpoint_interval
+                    and (checkpoint_task is None or checkpoint_task.done())
+                ):
+                    # Persist in background, never stall the stream
+                    checkpoint_task = asyncio.create_task(checkpoint(job.content))
+                    last_checkpoint = time.monotonic()
+    except asyncio.CancelledError:
+        if not job.stopped:
+            raise  # e.g. the worker shutting down
+        # Stopped by the user, keep the partial answer
+        asyncio.current_task().uncancel()
+        logger.info("LLM chat cancelled.")
+        job.append("\n\n> **[已停止生成]**")
+        status = "aborted"
+    except QuotaExceeded as e:
+        logger.warning(f"LLM quota exceeded: {e}")
+        job.error = ("warning", "您近期的使用量已超出额度，请稍后再试")
+        job.append("\n\n> **[额度不足]** 您近期的使用量已超出额度，请稍后再试🙏")
+        status = "aborted"
+    except (AdmissionRejected, AdmissionTimeout) as e:
+        logger.warning(f"LLM admission failed: {e}")
+        job.error = ("warning", "服务繁忙，请稍后再试")
+        job.append("\n\n> **[系统繁忙]** 当前排队人数过多，请稍后再试🙏")
+        status = "aborted"
+    except (CircuitOpen, TimeoutError) as e:
+        logger.warning(f"LLM unavailable: {e!r}")
+        job.error = ("warning", "模型服务暂时不可用，请稍后再试")
+        job.append("\n\n> **[系统繁忙]** 模型服务暂时不可用，请稍后再试🙏")
+        status = "aborted"
+    except RemoteProtocolError:
+        if response is not None:
+            llm_breaker.record_failure()  # broke off while streaming
+        logger.error(f"Context window overflow")
+        job.error = ("negative", "上下文超长")
+        job.append("\n\n> **[系统错误]** 上下文超长，模型崩溃😵💫🤯😇")
+        status = "aborted"
+    except Exception as e:
+        if response is not None:
+            llm_breaker.record_failure()
+        logger.error(f"LLM chat error: {e}")
+        job.error = ("negative", f"模型连接中断: {str(e)}")
+        job.append("\n\n> **[系统错误]** 模型连接中断🤕🤕🤕")
+        status = "aborted"
+
+    finally:
+        if response is not None and hasattr(response, "close"):
+            # Release the upstream connection at once, not at GC time
+            try:
+                await response.close()
+            except Exception as e:
+                logger.debug(f"Error closing LLM stream: {e!r}")
+        # Charge what the backend did, including aborted streams
+        if usage is not None:
+            used = usage.prompt_tokens + usage.completion_tokens
+        else:
+            used = (prompt_tokens + count_tokens(job.content)) if job.content else 0
+        llm_quota.charge(quota_key, used)
+        if checkpoint_task is not None:
+            await checkpoint_task
+
+    return status
@@ -0,0 +1,46 @@
+from .. import conf
+from ..runtime import (
+    AdmissionController,
+    CircuitBreaker,
+    QuotaManager,
+    register_metrics,
+)
+
+# Admission control of all requests to the generation LLM
+llm_admission = AdmissionController(
+    "llm",
+    max_concurrent=conf.llm.max_concurrent,
+    max_queue=conf.llm.max_queue,
+    timeout=conf.llm.queue_timeout,
+    host_max_concurrent=conf.llm.host_max_concurrent,
+)
+register_metrics("llm_admission", llm_admission.stats)
+
+# Per-user token accounting and budgets
+_overrides = conf.quota.overrides or {}
+llm_quota = QuotaManager(
+    tokens_per_minute=conf.quota.tokens_per_minute,
+    burst=conf.quota.burst,
+    scope=conf.quota.scope,
+    overrides=_overrides if isinstance(_overrides, dict) else vars(_overrides),
+)
+register_metrics("llm_quota", llm_quota.stats)
+
+
+def _breaker(name: str, timeout: float) -> CircuitBreaker:
+    breaker = CircuitBreaker(
+        name,
+        timeout=timeout,
+        failure_ratio=conf.breaker.failure_ratio,
+        min_calls=conf.breaker.min_calls,
+        window=conf.breaker.window,
+        reset_timeout=conf.breaker.reset_timeout,
+    )
+    register_metrics(f"{name}_breaker", breaker.stats)
+    return breaker
+
+
+# Fast failing of the backend dependencies when they degrade
+llm_breaker = _breaker("llm", conf.breaker.llm_timeout)
+retrieval_breaker = _breaker("retrieval", conf.breaker.retrieval_timeout)
+knowledge_breaker = _breaker("knowledge", conf.breaker.knowledge_timeout)
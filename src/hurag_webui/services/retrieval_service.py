@@ -0,0 +1,246 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from hurag.schemas import Knowledge
+
+from .. import conf, logger
+from ..runtime import CircuitOpen, TTLCache, register_metrics
+from .llm_service import llm_admission, retrieval_breaker
+from hurag.retrievers import retrieve
+
+from collections import deque
+import hashlib
+import re
+import time
+
+_retrieval_cache = TTLCache(
+    maxsize=conf.cache.retrieval_size,
+    ttl=conf.cache.retrieval_ttl,
+)
+register_metrics("retrieval_cache", _retrieval_cache.stats)
+
+# From the most to the least expensive, modes downgrade along this order
+_MODE_COSTS = ("global", "community", "mix", "naive")
+_MIN_SAMPLES = 5
+# {mode: deque([(finished, seconds), ...]), ...} of recent backend retrievals
+_mode_latency: dict[str, deque[tuple[float, float]]] = {}
+_downgrades = {"latency": 0, "queue": 0}
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a user query for cache lookups: collapse whitespace, lowercase."""
+    return " ".join(query.split()).lower()
+
+
+def _history_digest(history: list[str]) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for item in history:
+        h.update(normalize_query(item).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+async def retrieve_knowledge(
+    query: str,
+    history: list[str],
+    mode: str | None,
+    user_path: str,
+) -> list[tuple[Knowledge, float]]:
+    """
+    Retrieve knowledge segments for the query, through a TTL-bounded cache.
+
+    Identical retrievals in flight are coalesced into a single backend call.
+
+    Arguments:
+        query: The user query.
+        history: The previous user queries of the session.
+        mode: The RAG mode, None for daily mode which needs no retrieval.
+        user_path: The user path restricting the knowledge scope.
+
+    Returns:
+        A list of (Knowledge, score) tuples.
+
+    Raises:
+        CircuitOpen: Retrieval is failing, the backend is not called.
+        TimeoutError: The retrieval took longer than `breaker.retrieval_timeout`.
+    """
+    if mode is None:
+        return []
+
+    async def load():
+        start = time.monotonic()
+        try:
+            result = await retrieval_breaker.call(
+                lambda: retrieve(
+                    query=query,
+                    history=history,
+                    mode=mode,
+                    user_path=user_path,
+                )
+            )
+        except CircuitOpen:
+            raise  # not called, nothing to measure
+        except Exception:
+            # A failed retrieval counts as one that timed out, so the modes
+            # failing are downgraded like the slow ones
+            _record_latency(
+                mode, max(time.monotonic() - start, retrieval_breaker.timeout)
+            )
+            raise
+        _record_latency(mode, time.monotonic() - start)
+        return result
+
+    key = (normalize_query(query), mode, user_path, _history_digest(history))
+    knowledge_list = await _retrieval_cache.get_or_load(key, load)
+    # Cached lists are shared, hand out a shallow copy
+    return list(knowledge_list)
+
+
+# --- Latency-driven mode selection ---
+
+
+def _record_latency(mode: str, seconds: float) -> None:
+    now = time.monotonic()
+    samples = _mode_latency.setdefault(mode, deque())
+    samples.append((now, seconds))
+    while samples and now - samples[0][0] > conf.retrieval.latency_window:
+        samples.popleft()
+
+
+def _latency_p90(mode: str) -> float | None:
+    """The recent 90th percentile retrieval latency, None if too few samples."""
+    now = time.monotonic()
+    durations = sorted(
+        d
+        for t, d in _mode_latency.get(mode, ())
+        if now - t <= conf.retrieval.latency_window
+    )
+    if len(durations) < _MIN_SAMPLES:
+        return None
+    return durations[int(len(durations) * 0.9)]
+
+
+def select_mode(mode: str | None) -> str | None:
+    """
+    Downgrade the RAG mode to a cheaper one under load.
+
+    When the LLM queue of this worker is deeper than
+    `retrieval.downgrade_queue_depth`, any mode falls to "naive". Otherwise
+    modes whose recent retrievals exceed `retrieval.latency_budget` seconds
+    step down until one fits the budget. The latency samples of a mode expire
+    after `retrieval.latency_window` seconds, so a downgraded mode is tried
+    again once its slow samples are gone.
+
+    Arguments:
+        mode: The requested RAG mode, None for daily mode.
+
+    Returns:
+        The mode to use, the requested one if no downgrade is needed.
+    """
+    if mode not in _MODE_COSTS:
+        return mode
+    depth = conf.retrieval.downgrade_queue_depth
+    if depth and llm_admission.queue_depth >= depth and mode != "naive":
+        _downgrades["queue"] += 1
+        return "naive"
+    budget = conf.retrieval.latency_budget
+    if not budget:
+        return mode
+    selected = mode
+    for candidate in _MODE_COSTS[_MODE_COSTS.index(mode) :]:
+        selected = candidate
+        p90 = _latency_p90(candidate)
+        if p90 is None or p90 <= budget:
+            break
+    if selected != mode:
+        _downgrades["latency"] += 1
+    return selected
+
+
+def _latency_stats() -> dict:
+    stats = {f"downgrades_{k}": v for k, v in _downgrades.items()}
+    for mode in _MODE_COSTS:
+        samples = [d for _, d in _mode_latency.get(mode, ())]
+        stats[mode] = {
+            "samples": len(samples),
+            "avg": sum(samples) / len(samples) if samples else 0.0,
+            "p90": _latency_p90(mode) or 0.0,
+        }
+    return stats
+
+
+register_metrics("retrieval_latency", _latency_stats)
+
+
+# --- Near-duplicate elimination ---
+
+_SHINGLE_SIZE = 4
+_NOISE_PATTERN = re.compile(r"[\s\W_]+")
+
+
+def _shingles(text: str) -> frozenset[str]:
+    text = _NOISE_PATTERN.sub("", text).lower()
+    if len(text) <= _SHINGLE_SIZE:
+        return frozenset((text,))
+    return frozenset(
+        text[i : i + _SHINGLE_SIZE] for i in range(len(text) - _SHINGLE_SIZE + 1)
+    )
+
+
+def _preference(item: tuple[Knowledge, float]) -> tuple:
+    """Sort key preferring valid, then newer, then higher-scored segments."""
+    metadata = item[0].metadata
+    valid_from = metadata.valid_from or metadata.date
+    return (
+        metadata.valid_to is None,
+        f"{valid_from:%Y-%m-%d}" if valid_from else "",
+        item[1],
+    )
+
+
+def dedup_knowledge(
+    knowledge_list: list[tuple[Knowledge, float]],
+    threshold: float | None = None,
+) -> list[tuple[Knowledge, float]]:
+    """
+    Drop near-duplicate knowledge segments, e.g. successive versions of the
+    same regulation, by the Jaccard similarity of their character shingles.
+
+    Of each group of near-duplicates the newest valid version is kept, with
+    the best score of the group. The input list is not modified, so dropped
+    segments remain available as citations.
+
+    Arguments:
+        knowledge_list: A list of (Knowledge, score) tuples.
+        threshold: The similarity above which segments are duplicates,
+            defaults to `conf.retrieval.dedup_threshold`; 0 disables it.
+
+    Returns:
+        The deduplicated list of (Knowledge, score) tuples, by score desc.
+    """
+    threshold = conf.retrieval.dedup_threshold if threshold is None else threshold
+    if threshold <= 0 or len(knowledge_list) < 2:
+        return list(knowledge_list)
+
+    kept: list[list] = []  # [[knowledge, score, shingles], ...]
+    for knowledge, score in sorted(knowledge_list, key=_preference, reverse=True):
+        shingles = _shingles(knowledge.content or "")
+        for group in kept:
+            other = group[2]
+            # Jaccard similarity never exceeds the ratio of the set sizes
+            small, large = sorted((len(shingles), len(other)))
+            if small < threshold * large:
+                continue
+            if len(shingles & other) >= threshold * len(shingles | other):
+                group[1] = max(group[1], score)
+                break
+        else:
+            kept.append([knowledge, score, shingles])
+
+    if len(kept) < len(knowledge_list):
+        logger.debug(
+            f"Dropped {len(knowledge_list) - len(kept)} near-duplicate "
+            f"knowledge segments of {len(knowledge_list)}."
+        )
+    return sorted(((k, s) for k, s, _ in kept), key=lambda k: k[1], reverse=True)
@@ -4,11 +4,22 @@ from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from openai import AsyncOpenAI
 
-from .. import db_pool_name, oa_client_name, oa_model_name
+from .. import db_pool_name, oa_client_name, oa_model_name, logger
 from ..models import Session, Message
+from ..runtime import AdmissionRejected, AdmissionTimeout, TTLCache, register_metrics
+from .llm_service import llm_admission
 from hurag.llm import with_oa_client, chat, extract_response
 from datetime import datetime
 
+# Message contents by ID, held once for all the clients of the worker showing
+# them, and loaded again from the database once evicted
+_content_cache = TTLCache(maxsize=4096, ttl=1800)
+register_metrics("message_contents", _content_cache.stats)
+
+# Mode saved for responses in daily mode, NULL is left for responses saved
+# before modes were kept
+_DAILY_MODE = "daily"
+
 
 async def load_session_by_id(session_id: str) -> Session | None:
     """
@@ -70,6 +81,9 @@ async def upsert_session(
     session_id: str | None = None,
     title: str | None = None,
     user_id: str | None = None,
+    scores: list[float] | None = None,
+    status: str = "complete",
+    mode: str | None = None,
 ) -> tuple[Session, Message, Message]:
     """
     Insert new session or update existed session.
@@ -83,6 +97,10 @@ async def upsert_session(
         session_id: ID of an existed session or None when creating new session.
         title: title of the session, required when creating new session.
         user_id: ID of the user, required when creating new session.
+        scores: relevance scores of the citations, in the same order.
+        status: status of the response, "streaming" to finish it later with
+            `finish_response`.
+        mode: RAG mode the response is generated in, None for daily mode.
 
     Return:
         A tuple containing:
@@ -104,18 +122,22 @@ async def upsert_session(
     """
     INSERT_RESPONSE = """
         INSERT INTO session_messages
-            (id, session_id, seq_no, role, content, created_ts, pair_id)
+            (id, session_id, seq_no, role, content, created_ts, pair_id, status,
+            mode)
         VALUES
-            (%s, %s, %s, 'assistant', %s, %s, %s)
+            (%s, %s, %s, 'assistant', %s, %s, %s, %s, %s)
     """
     INSERT_CITATIONS = """
-        INSERT INTO query_segments (query_id, segment_id, seq_no) VALUES (%s, %s, %s)
+        INSERT INTO query_segments (query_id, segment_id, seq_no, score)
+        VALUES (%s, %s, %s, %s)
     """
     GET_LAST_SEQ_NO = "SELECT max(seq_no) FROM session_messages WHERE session_id = %s"
     UPDATE_SESSION = "UPDATE sessions SET created_ts = %s WHERE id = %s"
     query_id = generate_id()
     response_id = generate_id()
     session_ts = datetime.now()
+    scores = scores or [None] * len(citation_ids or [])
+    stored_mode = mode or _DAILY_MODE
     if not session_id:
         session_id = generate_id()
         statements = [
@@ -126,12 +148,24 @@ async def upsert_session(
         data = [
             (session_id, title, session_ts, user_id),
             (query_id, session_id, 0, query, query_ts, response_id),
-            (response_id, session_id, 1, response, response_ts, query_id),
+            (
+                response_id,
+                session_id,
+                1,
+                response,
+                response_ts,
+                query_id,
+                status,
+                stored_mode,
+            ),
         ]
         if citation_ids:
             statements.append(INSERT_CITATIONS)
             data.append(
-                [(response_id, cid, seq + 1) for seq, cid in enumerate(citation_ids)]
+                [
+                    (response_id, cid, seq + 1, score)
+                    for seq, (cid, score) in enumerate(zip(citation_ids, scores))
+                ]
             )
         await rss.transact(statements, data, pool_name=db_pool_name)
         s = Session(id=session_id, title=title, created_ts=session_ts, user_id=user_id)
@@ -152,6 +186,7 @@ async def upsert_session(
             content=response,
             created_ts=response_ts,
             pair_id=query_id,
+            status=status,
         )
         return s, q, r
     # update existed session
@@ -183,6 +218,8 @@ async def upsert_session(
                     response,
                     response_ts,
                     query_id,
+                    status,
+                    stored_mode,
                 ),
                 (session_ts, session_id),
             ]
@@ -193,8 +230,8 @@ async def upsert_session(
                 await cur.executemany(
                     INSERT_CITATIONS,
                     [
-                        (response_id, cid, seq + 1)
-                        for seq, cid in enumerate(citation_ids)
+                        (response_id, cid, seq + 1, score)
+                        for seq, (cid, score) in enumerate(zip(citation_ids, scores))
                     ],
                 )
 
@@ -220,10 +257,225 @@ async def upsert_session(
         content=response,
         created_ts=response_ts,
         pair_id=query_id,
+        status=status,
     )
     return None, q, r
 
 
+async def insert_response_variant(
+    query_id: str,
+    session_id: str,
+    response: str,
+    response_ts: datetime,
+    citation_ids: list[str] | None = None,
+    scores: list[float] | None = None,
+    status: str = "complete",
+    mode: str | None = None,
+) -> Message:
+    """
+    Insert a regenerated response as a new variant answering an existing query.
+
+    The variant is appended to the session as the latest message, and the
+    query is re-paired with it, so it replaces the previous variants in the
+    chat history.
+
+    Arguments:
+        query_id: ID of the user query.
+        session_id: ID of the session.
+        response: LLM response.
+        response_ts: timestamp of LLM response.
+        citation_ids: list of citation IDs, empty if None.
+        scores: relevance scores of the citations, in the same order.
+        status: status of the response, "streaming" to finish it later with
+            `finish_response`.
+        mode: RAG mode the response is generated in, None for daily mode.
+
+    Returns:
+        The Message object for the LLM response.
+    """
+    from hurag.dss import rss
+    from .. import generate_id
+
+    response_id = generate_id()
+    scores = scores or [None] * len(citation_ids or [])
+    pool = await rss.get_pool(pool_name=db_pool_name)
+    async with pool.acquire() as conn, conn.cursor() as cur:
+        await conn.begin()
+        try:
+            await cur.execute(
+                "SELECT 1 FROM sessions WHERE id = %s FOR UPDATE", (session_id,)
+            )
+            await cur.execute(
+                """
+                SELECT
+                    (SELECT max(seq_no) FROM session_messages WHERE session_id = %s),
+                    (SELECT max(variant_no) FROM session_messages WHERE pair_id = %s)
+                """,
+                (session_id, query_id),
+            )
+            last_seq_no, last_variant_no = await cur.fetchone()
+            seq_no = (last_seq_no if last_seq_no is not None else -1) + 1
+            variant_no = (last_variant_no or 0) + 1
+
+            await cur.execute(
+                """
+                INSERT INTO session_messages
+                    (id, session_id, seq_no, role, content, created_ts, pair_id,
+                    variant_no, status, mode)
+                VALUES
+                    (%s, %s, %s, 'assistant', %s, %s, %s, %s, %s, %s)
+                """,
+                (
+                    response_id,
+                    session_id,
+                    seq_no,
+                    response,
+                    response_ts,
+                    query_id,
+                    variant_no,
+                    status,
+                    mode or _DAILY_MODE,
+                ),
+            )
+            await cur.execute(
+                "UPDATE session_messages SET pair_id = %s WHERE id = %s",
+                (response_id, query_id),
+            )
+            await cur.execute(
+                "UPDATE sessions SET created_ts = %s WHERE id = %s",
+                (datetime.now(), session_id),
+            )
+            if citation_ids:
+                await cur.executemany(
+                    """
+                    INSERT INTO query_segments (query_id, segment_id, seq_no, score)
+                    VALUES (%s, %s, %s, %s)
+                    """,
+                    [
+                        (response_id, cid, seq + 1, score)
+                        for seq, (cid, score) in enumerate(zip(citation_ids, scores))
+                    ],
+                )
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
+
+    return Message(
+        id=response_id,
+        session_id=session_id,
+        seq_no=seq_no,
+        role="assistant",
+        content=response,
+        created_ts=response_ts,
+        pair_id=query_id,
+        variant_no=variant_no,
+        status=status,
+    )
+
+
+async def load_response_mode(response_id: str, default: str | None) -> str | None:
+    """
+    Load the RAG mode a response was generated in.
+
+    Arguments:
+        response_id: The ID of the response.
+        default: The mode returned when the mode of the response is unknown.
+
+    Returns:
+        The RAG mode, None for daily mode.
+    """
+    from hurag.dss import rss
+
+    rows = await rss.query(
+        "SELECT mode FROM session_messages WHERE id = %s",
+        (response_id,),
+        pool_name=db_pool_name,
+    )
+    if not rows or rows[0][0] is None:
+        return default
+    return None if rows[0][0] == _DAILY_MODE else rows[0][0]
+
+
+async def checkpoint_response(response_id: str, content: str):
+    """Save the partial content of a response while it is streaming."""
+    from hurag.dss import rss
+
+    await rss.dml(
+        """
+        UPDATE session_messages SET content = %s
+        WHERE id = %s AND status = 'streaming'
+        """,
+        (content, response_id),
+        pool_name=db_pool_name,
+    )
+
+
+async def finish_response(
+    response_id: str,
+    content: str,
+    response_ts: datetime,
+    status: str = "complete",
+    formatted: str | None = None,
+):
+    """Save the final content, formatted content and status of a response."""
+    from hurag.dss import rss
+
+    await rss.dml(
+        """
+        UPDATE session_messages
+        SET content = %s, created_ts = %s, status = %s, formatted = %s
+        WHERE id = %s
+        """,
+        (content, response_ts, status, formatted, response_id),
+        pool_name=db_pool_name,
+    )
+
+
+async def save_formatted_messages(formatted: dict[str, str]):
+    """Save the formatted content of messages, {message_id: formatted}."""
+    if not formatted:
+        return
+
+    from hurag.dss import rss
+
+    await rss.transact(
+        [
+            """
+            UPDATE session_messages SET formatted = %s
+            WHERE id = %s AND status != 'streaming'
+            """
+        ],
+        [[(text, message_id) for message_id, text in formatted.items()]],
+        pool_name=db_pool_name,
+    )
+
+
+async def load_formatted_messages(message_ids: list[str]) -> dict[str, str]:
+    """
+    Load the formatted content saved for messages.
+
+    Arguments:
+        message_ids: The IDs of the messages.
+
+    Returns:
+        A dictionary mapping message IDs to their formatted content, messages
+        not formatted yet are left out.
+    """
+    if not message_ids:
+        return {}
+
+    from hurag.dss import rss
+
+    query = f"""
+    SELECT id, formatted FROM session_messages
+    WHERE id IN ({", ".join(["%s"] * len(message_ids))})
+    AND formatted IS NOT NULL AND status != 'streaming'
+    """
+    rows = await rss.query(query, tuple(message_ids), pool_name=db_pool_name)
+    return {message_id: formatted for message_id, formatted in rows}
+
+
 async def load_messages_by_session(session_id: str) -> list[Message]:
     """
     Load messages for a given session.
@@ -249,7 +501,10 @@ async def load_messages_by_session(session_id: str) -> list[Message]:
         created_ts,
         likes,
         dislikes,
-        pair_id
+        pair_id,
+        variant_no,
+        status,
+        formatted
     FROM session_messages
     WHERE session_id = %s
     ORDER BY seq_no ASC
@@ -288,6 +543,69 @@ async def load_citation_ids_by_session(session_id: str) -> dict[str, str]:
 
     return citation_ids
 
+
+async def load_citation_ids_by_message(message_id: str) -> list[str]:
+    """
+    Load the citation segment IDs of a response.
+
+    Arguments:
+        message_id: The ID of the response.
+
+    Returns:
+        A list of citation segment IDs, in citation order.
+    """
+    if not message_id:
+        return []
+
+    from hurag.dss import rss
+
+    query = """
+    SELECT segment_id FROM query_segments WHERE query_id = %s ORDER BY seq_no ASC
+    """
+    rows = await rss.query(query, (message_id,), pool_name=db_pool_name)
+    return [row[0] for row in rows]
+
+
+def remember_message_contents(contents: dict[str, str]) -> None:
+    """Cache the contents of messages by ID, for `load_message_contents`."""
+    for message_id, content in contents.items():
+        _content_cache.set(message_id, content)
+
+
+async def load_message_contents(message_ids: list[str]) -> dict[str, str]:
+    """
+    Load the contents of messages, from the cache or the database.
+
+    Arguments:
+        message_ids: The IDs of the messages.
+
+    Returns:
+        A dictionary mapping message IDs to their contents, missing messages
+        are left out.
+    """
+    contents = {}
+    missing = []
+    for message_id in message_ids:
+        content = _content_cache.get(message_id)
+        if content is None:
+            missing.append(message_id)
+        else:
+            contents[message_id] = content
+    if not missing:
+        return contents
+
+    from hurag.dss import rss
+
+    query = f"""
+    SELECT id, content FROM session_messages
+    WHERE id IN ({", ".join(["%s"] * len(missing))})
+    """
+    rows = await rss.query(query, tuple(missing), pool_name=db_pool_name)
+    loaded = {message_id: content or "" for message_id, content in rows}
+    remember_message_contents(loaded)
+    return contents | loaded
+
+
 @with_oa_client(client_name=oa_client_name)
 async def generate_session_title(
     query: str,
@@ -310,19 +628,97 @@ async def generate_session_title(
             "你是一名助手，需根据用户的查询生成简洁且相关的会话标题。"
             "请输出能抓住查询核心、字数精炼的标题。"
         )
+        try:
+            async with llm_admission.slot():
+                response = await chat(
+                    model=oa_model_name,
+                    prompt=(
+                        f"基于以下用户查询生成一个不超过 {max_length} 字的简洁标题："
+                        f"{query}"
+                    ),
+                    system_prompt=system_prompt,
+                    client=oaclient,
+                    temperature=0.5,
+                    stream=False,
+                    timeout=30.0,
+                )
+        except (AdmissionRejected, AdmissionTimeout) as e:
+            # LLM is busy, do not let the title hold the session up
+            logger.warning(f"Session title falls back to the query: {e}")
+            return title[:max_length]
+        title = extract_response(response).strip()
+    return title
+
+
+@with_oa_client(client_name=oa_client_name)
+async def summarize_history(
+    summary: str | None,
+    messages: list[dict[str, str]],
+    max_length: int = 500,
+    oaclient: AsyncOpenAI | None = None,
+) -> str:
+    """
+    Fold chat messages into the rolling summary of a session.
+
+    Arguments:
+        summary: The current summary, None if there is none yet.
+        messages: The messages to fold, as {"role": ..., "content": ...}.
+        max_length: The maximum length of the summary.
+
+    Returns:
+        The new summary.
+    """
+    from ..prompts import SUMMARY_PROMPT_TEMPLATE
+
+    dialogue = "\n\n".join(
+        f"{'用户' if m['role'] == 'user' else '助手'}：{m['content']}"
+        for m in messages
+    )
+    async with llm_admission.slot():
         response = await chat(
             model=oa_model_name,
-            prompt=(
-                f"基于以下用户查询生成一个不超过 {max_length} 字的简洁标题：{query}"
+            prompt=SUMMARY_PROMPT_TEMPLATE.format(
+                max_length=max_length,
+                summary=summary or "无",
+                dialogue=dialogue,
             ),
-            system_prompt=system_prompt,
             client=oaclient,
-            temperature=0.5,
+            temperature=0,
             stream=False,
-            timeout=30.0,
+            timeout=120.0,
         )
-        title = extract_response(response).strip()
-    return title
+    return extract_response(response).strip()
+
+
+async def load_session_summary(session_id: str) -> tuple[str | None, int]:
+    """
+    Load the rolling summary of a session.
+
+    Arguments:
+        session_id: The ID of the session.
+
+    Returns:
+        A tuple of the summary, None if there is none, and the seq_no of the
+        last query it covers, -1 if there is none.
+    """
+    from hurag.dss import rss
+
+    rows = await rss.query(
+        "SELECT summary, summary_upto FROM sessions WHERE id = %s",
+        (session_id,),
+        pool_name=db_pool_name,
+    )
+    return rows[0] if rows else (None, -1)
+
+
+async def update_session_summary(session_id: str, summary: str, upto: int):
+    from hurag.dss import rss
+
+    await rss.dml(
+        "UPDATE sessions SET summary = %s, summary_upto = %s WHERE id = %s",
+        (summary, upto, session_id),
+        pool_name=db_pool_name,
+    )
 
 
 async def dislike_message(message_id: str, dislikes: int):
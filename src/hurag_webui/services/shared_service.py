@@ -0,0 +1,17 @@
+from .. import conf
+from ..runtime import SharedState, register_metrics
+
+# State shared by the worker processes on this host: second-level caches that
+# warm each other, and events such as changed session lists
+shared_state = SharedState(
+    conf.mariadb.database,
+    path=conf.shared.path,
+    poll_interval=conf.shared.poll_interval,
+    event_ttl=conf.shared.event_ttl,
+)
+register_metrics("shared_state", shared_state.stats)
+
+
+def sessions_topic(user_id: str) -> str:
+    """The topic of changes to the session list of a user."""
+    return f"sessions:{user_id}"
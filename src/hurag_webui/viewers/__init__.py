@@ -3,14 +3,19 @@ from .user_viewer import user_manager
 from .session_viewer import (
     show_session_history,
     join_history_session,
+    render_message,
     session_browser,
 )
+from .message_list import MessageList
 from .chat_viewer import (
     display_user_message,
     display_bot_message,
     display_message_footer,
+    display_streaming_message,
+    display_variant_label,
     scroll_to_bottom,
-    chat_with_backend,
+    follow_generation,
+    display_generation,
 )
 
 __all__ = [
@@ -18,10 +23,15 @@ __all__ = [
     "user_manager",
     "show_session_history",
     "join_history_session",
+    "render_message",
+    "MessageList",
     "display_user_message",
     "display_bot_message",
     "display_message_footer",
+    "display_streaming_message",
+    "display_variant_label",
     "scroll_to_bottom",
-    "chat_with_backend",
+    "follow_generation",
+    "display_generation",
     "session_browser",
 ]
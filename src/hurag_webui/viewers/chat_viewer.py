@@ -1,9 +1,8 @@
 from __future__ import annotations
-from typing import Any, Literal, TYPE_CHECKING
+from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
-    from hurag.schemas import Knowledge
-    from openai import AsyncOpenAI
+    from ..runtime import StreamJob
 
 from ..events import (
     Copy_response_clicked,
@@ -13,17 +12,16 @@ from ..events import (
     Download_response_clicked,
     Show_message_citations_clicked,
 )
-from .. import logger, conf, oa_client_name, oa_model_name
-from hurag.llm import with_oa_client, chat, extract_chunk
+
+from .rendering import MARKDOWN_EXTRAS, format_markdown
+from .streaming_markdown import StreamingMarkdown
 
 from nicegui import ui
 from datetime import datetime
+import asyncio
+import time
 
-_CTX_SIZE_MAP = {
-    "tiny": (4, -2),  # 4 docs, 1 history round
-    "medium": (5, -10),  # 5 docs, 5 history rounds
-    "large": (None, None),  # unlimited
-}
+_RENDER_INTERVAL = 0.08  # seconds between two renders of a streaming response
 
 
 async def display_user_message(
@@ -37,29 +35,46 @@ async def display_user_message(
     )
 
 
-async def display_bot_message(content) -> ui.markdown:
-    """Display a bot message in the chat viewer."""
-    import mdformat
+async def display_bot_message(
+    content: str,
+    formatted: str | None = None,
+) -> ui.markdown:
+    """Display a bot message in the chat viewer, formatted if not yet."""
     return ui.markdown(
-        mdformat.text(content) if content else "",
+        formatted if formatted is not None else await format_markdown(content),
         # content if content else "",
-        extras=["fenced-code-blocks", "tables", "latex", "mermaid"],
+        extras=MARKDOWN_EXTRAS,
     ).classes("w-full max-w-full text-gray-800")
 
 
+async def display_variant_label(variant_no: int) -> ui.label:
+    """Mark a regenerated response, above it, with its variant number."""
+    return ui.label(f"↻ 重新生成 · 第 {variant_no + 1} 版回答").classes(
+        "text-caption text-gray-500 q-mt-sm"
+    )
+
+
+async def display_streaming_message() -> StreamingMarkdown:
+    """Display an empty bot message that a streaming response goes into."""
+    return StreamingMarkdown(extras=MARKDOWN_EXTRAS).classes(
+        "w-full max-w-full text-gray-800"
+    )
+
+
 async def display_message_footer(
     message_id: str | None,
     pair_id: str | None,
     timestamp: datetime = datetime.now(),
     likes: int = 0,
     dislikes: int = 0,
+    cached: bool = False,
 ) -> ui.column:
     """Display a footer for a message with actions like 'like' and 'dislike'."""
     footer_col = ui.column().classes("w-full self-stretch items-stretch gap-0")
     with footer_col:
         ui.markdown(
-            f"---\n*以上内容为人工智能生成，仅供参考。*"
-            f" {timestamp.strftime('%Y-%m-%d %H:%M')}",
+            f"---\n*以上内容{'来自相同问题的缓存答案，由' if cached else '为'}"
+            f"人工智能生成，仅供参考。* {timestamp.strftime('%Y-%m-%d %H:%M')}",
         ).classes("text-caption text-gray-500 mb-0")
         if message_id:
             with ui.row().classes("justify-left py-0 my-0"):
@@ -119,79 +134,67 @@ async def scroll_to_bottom(c):
     )
 
 
-@with_oa_client(client_name=oa_client_name)
-async def chat_with_backend(
+async def follow_generation(
+    bot_msg_md: StreamingMarkdown,
+    job: StreamJob,
     container: ui.column,
-    mode: Literal["naive", "mix", "community", "global"] | None,
-    message: str,
-    knowledge_list: list[tuple[Knowledge, float]],
-    system_prompt: str | None = None,
-    history: list | None = None,
-    temperature: float | None = 0,
-    timeout: int = 180,
-    oaclient: AsyncOpenAI | None = None,
-) -> tuple[str, datetime]:
+) -> None:
+    """
+    Render the output of a generation job until the job is done.
+
+    Chunks are coalesced into at most one render every `_RENDER_INTERVAL`
+    seconds, each render sends only the changed part to the browser, and the
+    whole response is formatted once at the end, off the event loop.
     """
-    Chat with the backend LLM service and display the response.
+    last_render = 0.0
+    rendered = None
+    async for _ in job.follow():
+        if job.done:
+            continue  # rendered in full below
+        wait = last_render + _RENDER_INTERVAL - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)  # let the following chunks pile up
+        content, notice = job.content, job.notice
+        if (len(content), notice) == rendered:
+            continue
+        if content:
+            await bot_msg_md.stream(content)
+        else:
+            bot_msg_md.set_content(f"*{notice}*" if notice else "")
+        rendered = (len(content), notice)
+        last_render = time.monotonic()
+        await scroll_to_bottom(container)
+
+    bot_msg_md.finish(await format_markdown(job.content))
+    await scroll_to_bottom(container)
+
+
+async def display_generation(
+    container: ui.column,
+    job: StreamJob,
+    parent: ui.element | None = None,
+) -> tuple[str, datetime, str]:
+    """
+    Display the response of a generation job while it streams.
+
+    The job runs on its own, leaving the page before it is done does not stop
+    the generation.
 
     Arguments:
         container: The UI container to display the chat messages.
-        mode: The chat mode.
-        message: The user message used to create the prompt.
-        knowledge_list: The list of knowledge items to use.
-        system_prompt: The system prompt.
-        history: The chat history.
-        temperature: The temperature for the LLM.
-        timeout: The timeout for the backend request.
-        oaclient: Placeholder for injecting an OpenAI client.
+        job: The generation job to follow.
+        parent: The element in the container to add the response to, if not
+            the container itself.
 
     Returns:
         A tuple containing:
             - The message of the bot response.
             - The timestamp of the bot response.
+            - The status of the response, "aborted" if it is cut by an error.
     """
-    from httpx import RemoteProtocolError
-    import mdformat
-
-    content = ""
-    if mode:
-        from ..prompts import create_rag_prompt
-
-        prompt = create_rag_prompt(
-            query=message,
-            knowledge_list=knowledge_list,
-            kn_limit=_CTX_SIZE_MAP[conf.services.ctx_size][0],
-        )
-    else:
-        prompt = message
-
-    hist_limit = _CTX_SIZE_MAP[conf.services.ctx_size][1]
-    with container:
-        bot_msg_md = await display_bot_message("")
-        try:
-            response = await chat(
-                model=oa_model_name,
-                prompt=prompt,
-                system_prompt=system_prompt,
-                history_messages=history[hist_limit:] if hist_limit else history,
-                client=oaclient,
-                temperature=temperature,
-                stream=True,
-                timeout=timeout,
-            )
-            async for chunk in response:
-                content += extract_chunk(chunk)
-                # bot_msg_md.set_content(content)
-                bot_msg_md.set_content(mdformat.text(content) if content else "")
-                await scroll_to_bottom(container)
-        except RemoteProtocolError:
-            logger.error(f"Context window overflow")
-            ui.notify("上下文超长", type="negative")
-            content += "\n\n> **[系统错误]** 上下文超长，模型崩溃😵💫🤯😇"
-        except Exception as e:
-            logger.error(f"LLM chat error: {e}")
-            ui.notify(f"模型连接中断: {str(e)}", type="negative")
-            content += "\n\n> **[系统错误]** 模型连接中断🤕🤕🤕"
-
-        # bot_msg_md.set_content(mdformat.text(content))
-    return content, datetime.now()
+    with parent or container:
+        bot_msg_md = await display_streaming_message()
+        await follow_generation(bot_msg_md, job, container)
+        if job.error:
+            ui.notify(job.error[1], type=job.error[0])
+    return job.content, job.finished_ts, job.status
@@ -3,6 +3,7 @@ from typing import Sequence
 
 from ..models import Citation
 from ..services import load_citations_by_ids
+from .rendering import MARKDOWN_EXTRAS, citation_briefs
 
 
 async def show_citations(
@@ -49,8 +50,9 @@ async def show_citations(
         id_to_citation = {c.id: c for c in citations}
         citations = [id_to_citation[cid] for cid in ids if cid in id_to_citation]
 
+    briefs = await citation_briefs(citations)
     with ui_card:
-        for i, ct in enumerate(citations):
+        for i, (ct, brief) in enumerate(zip(citations, briefs)):
             with (
                 ui.column(wrap=True)
                 .classes(
@@ -61,10 +63,9 @@ async def show_citations(
             ):
                 ui.tooltip("查看全文...").classes("text-caption")
                 ui.label(f"{i + 1}.{ct.doc}").classes("text-body2 font-semibold")
-                ui.markdown(
-                    ct.brief,
-                    extras=["fenced-code-blocks", "tables", "latex", "mermaid"],
-                ).classes("text-body2 text-gray-700")
+                ui.markdown(brief, extras=MARKDOWN_EXTRAS).classes(
+                    "text-body2 text-gray-700"
+                )
 
 
 # --- Event handlers ---
@@ -0,0 +1,203 @@
+from typing import Awaitable, Callable
+
+from ..constants import LOAD_MORE_OBSERVER_JS
+
+from nicegui import ui
+
+_PREFETCH_MARGIN = 800  # pixels around the view to build turns in advance
+
+
+class _Turn:
+    """The IDs of the messages shown together, and their column when live."""
+
+    __slots__ = ("message_ids", "column")
+
+    def __init__(self, message_ids: list[str], column: ui.column | None = None):
+        self.message_ids = message_ids
+        self.column = column
+
+
+class MessageList:
+    """
+    A windowed list of chat turns in a scrollable container.
+
+    Only up to `max_live` turns around the view are live elements. Sentinels
+    at the top and the bottom of the live turns load `page` more turns as
+    they come near the view, built again from the messages loaded by
+    `source`, and turns on the other side beyond `max_live` are deleted.
+
+    Arguments:
+        container: The scrollable column showing the messages.
+        source: Loads messages by ID, returned as {id: message dict}.
+        render: Displays a message dict in the current context.
+    """
+
+    def __init__(
+        self,
+        container: ui.column,
+        source: Callable[[list[str]], Awaitable[dict[str, dict]]],
+        render: Callable[[dict], Awaitable[None]],
+        max_live: int = 30,
+        page: int = 10,
+    ):
+        self.container = container
+        self.source = source
+        self.render = render
+        self.max_live = max_live
+        self.page = page
+        self._turns: list[_Turn] = []
+        self._start = 0  # live turns are self._turns[self._start : self._end]
+        self._end = 0
+        self._top: ui.element | None = None
+        self._bottom: ui.element | None = None
+        self._busy = False
+
+    def reset(self) -> None:
+        """Forget all turns and clear the container."""
+        self._turns.clear()
+        self._start = self._end = 0
+        self._top = self._bottom = None
+        self.container.clear()
+
+    async def load(self, turns: list[list[str]], messages: dict[str, dict]) -> None:
+        """
+        Show the turns of a session, given as lists of message IDs, the latest
+        turns are built from `messages` which are at hand already.
+        """
+        self.reset()
+        self._turns = [_Turn(ids) for ids in turns]
+        self._start = self._end = len(self._turns)
+        await self._extend_up(self.max_live, messages)
+        self._arm()
+
+    async def new_turn(self, message_ids: list[str] | None = None) -> ui.column:
+        """
+        Add a turn after the last one and return its column, the messages
+        displayed in it are set later with `record` when known.
+        """
+        if self._end < len(self._turns):
+            # Scrolled away from the end, jump back to the latest turns
+            for turn in self._turns[self._start : self._end]:
+                self._drop(turn)
+            self._start = self._end = len(self._turns)
+            await self._extend_up(self.page)
+        with self.container:
+            column = ui.column().classes("w-full items-stretch gap-0")
+        self._turns.append(_Turn(list(message_ids or []), column))
+        self._end = len(self._turns)
+        self._evict_top()
+        self._arm()
+        return column
+
+    def record(self, column: ui.column, message_ids: list[str]) -> None:
+        """Set the messages displayed in the column of a new turn."""
+        for turn in reversed(self._turns):
+            if turn.column is column:
+                turn.message_ids = list(message_ids)
+                return
+
+    # --- Windowing ---
+
+    async def _build(
+        self, turn: _Turn, messages: dict[str, dict] | None = None
+    ) -> ui.column:
+        if messages is None:
+            messages = await self.source(turn.message_ids)
+        with self.container:
+            column = ui.column().classes("w-full items-stretch gap-0")
+            with column:
+                for message_id in turn.message_ids:
+                    message = messages.get(message_id)
+                    if message is not None:
+                        await self.render(message)
+        turn.column = column
+        return column
+
+    def _drop(self, turn: _Turn) -> None:
+        if turn.column is not None and not turn.column.is_deleted:
+            self.container.remove(turn.column)
+        turn.column = None
+
+    async def _extend_up(
+        self, count: int, messages: dict[str, dict] | None = None
+    ) -> None:
+        start = max(0, self._start - count)
+        for index, turn in enumerate(self._turns[start : self._start]):
+            column = await self._build(turn, messages)
+            column.move(target_index=index + (1 if self._top is not None else 0))
+        self._start = start
+
+    async def _extend_down(self, count: int) -> None:
+        end = min(len(self._turns), self._end + count)
+        for turn in self._turns[self._end : end]:
+            await self._build(turn)
+        if self._bottom is not None:
+            self._bottom.move(target_index=-1)
+        self._end = end
+
+    def _evict_top(self) -> None:
+        while self._end - self._start > self.max_live:
+            self._drop(self._turns[self._start])
+            self._start += 1
+
+    def _evict_bottom(self) -> None:
+        while self._end - self._start > self.max_live:
+            self._end -= 1
+            self._drop(self._turns[self._end])
+
+    async def _load_above(self) -> None:
+        if self._busy or self._start == 0:
+            return
+        self._busy = True
+        try:
+            await self._extend_up(self.page)
+            self._evict_bottom()
+        finally:
+            self._busy = False
+        self._arm()
+
+    async def _load_below(self) -> None:
+        if self._busy or self._end >= len(self._turns):
+            return
+        self._busy = True
+        try:
+            await self._extend_down(self.page)
+            self._evict_top()
+        finally:
+            self._busy = False
+        self._arm()
+
+    def _sentinel(self, handler: Callable[[], Awaitable[None]]) -> ui.element:
+        with self.container:
+            sentinel = ui.element("div").classes("w-full h-px shrink-0")
+        sentinel.on("loadmore", handler)
+        return sentinel
+
+    def _arm(self) -> None:
+        """Put sentinels where turns are not live, and observe them."""
+        if self._start > 0:
+            if self._top is None or self._top.is_deleted:
+                self._top = self._sentinel(self._load_above)
+            self._top.move(target_index=0)
+            self._observe(self._top)
+        elif self._top is not None:
+            self.container.remove(self._top)
+            self._top = None
+
+        if self._end < len(self._turns):
+            if self._bottom is None or self._bottom.is_deleted:
+                self._bottom = self._sentinel(self._load_below)
+            self._bottom.move(target_index=-1)
+            self._observe(self._bottom)
+        elif self._bottom is not None:
+            self.container.remove(self._bottom)
+            self._bottom = None
+
+    def _observe(self, sentinel: ui.element) -> None:
+        ui.run_javascript(
+            LOAD_MORE_OBSERVER_JS.format(
+                sentinel_id=sentinel.id,
+                root_id=f"c{self.container.id}",
+                margin=_PREFETCH_MARGIN,
+            )
+        )
@@ -0,0 +1,75 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..models import Citation
+
+from .. import conf
+from ..runtime import RenderPool, TTLCache, register_metrics
+
+import hashlib
+
+MARKDOWN_EXTRAS = ["fenced-code-blocks", "tables", "latex", "mermaid"]
+
+# Formatting markdown is pure Python and slow for long texts, keep it off the
+# event loop so it never holds up the other clients of the worker
+render_pool = RenderPool(
+    "markdown",
+    workers=conf.render.workers,
+    max_queue=conf.render.max_queue,
+)
+register_metrics("render_pool", render_pool.stats)
+
+# Formatted markdown by content hash, a response is formatted once for saving
+# and reused by the clients showing it, or showing it again when scrolled back
+_formatted_cache = TTLCache(maxsize=1024, ttl=600)
+register_metrics("formatted_cache", _formatted_cache.stats)
+
+
+def _fill_html_cache(text: str, extras: list[str]) -> str:
+    from nicegui.elements.markdown import prepare_content
+
+    prepare_content(text, extras=" ".join(extras))
+    return text
+
+
+def _format_markdown(content: str, extras: list[str]) -> str:
+    import mdformat
+
+    # Fill the HTML cache of ui.markdown, so showing the text is a cache hit
+    return _fill_html_cache(mdformat.text(content), extras)
+
+
+def _formatted_key(content: str, extras: list[str]) -> tuple[str, str]:
+    return (
+        hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest(),
+        " ".join(extras),
+    )
+
+
+async def _load_formatted(content: str, extras: list[str], key: str) -> str:
+    from ..services import shared_state
+
+    # Formatted by another worker, only the HTML is converted here
+    text = await shared_state.get("formatted", key)
+    if text is not None:
+        return await render_pool.run(_fill_html_cache, text, extras)
+    text = await render_pool.run(_format_markdown, content, extras)
+    await shared_state.set("formatted", key, text, conf.shared.cache_ttl)
+    return text
+
+
+async def format_markdown(content: str, extras: list[str] | None = None) -> str:
+    """Format markdown content for display, in the render pool."""
+    if not content:
+        return ""
+    extras = MARKDOWN_EXTRAS if extras is None else extras
+    key = _formatted_key(content, extras)
+    return await _formatted_cache.get_or_load(
+        key, lambda: _load_formatted(content, extras, "\x1f".join(key))
+    )
+
+
+async def citation_briefs(citations: list[Citation]) -> list[str]:
+    """Sanitize the briefs of citations for display, in the render pool."""
+    return await render_pool.run(lambda: [ct.brief for ct in citations])
@@ -1,3 +1,9 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ..runtime import StreamJob
+    from .streaming_markdown import StreamingMarkdown
+
 from ..models import Session, Message
 from ..events import (
     History_session_clicked,
@@ -9,125 +15,278 @@ from .chat_viewer import (
     display_bot_message,
     display_user_message,
     display_message_footer,
+    display_streaming_message,
+    display_variant_label,
+    follow_generation,
     scroll_to_bottom,
 )
+from .message_list import MessageList
+from .rendering import format_markdown
 
 from nicegui import ui
+import asyncio
+import weakref
+
+
+class _SessionRow:
+    """The elements of a session row that change with the session."""
+
+    __slots__ = ("row", "label", "tooltip")
+
+    def __init__(self, row: ui.row, label: ui.label, tooltip: ui.tooltip):
+        self.row = row
+        self.label = label
+        self.tooltip = tooltip
+
+
+class _Sidebar:
+    """The session rows of a sidebar, and the context menu they share."""
+
+    __slots__ = ("rows", "menu", "session_id")
+
+    def __init__(self):
+        self.rows: dict[str, _SessionRow] = {}
+        self.menu: ui.menu | None = None
+        self.session_id: str | None = None  # the session the menu is open for
+
+
+_BATCH_SIZE = 20  # sessions loaded at a time in the session browser
+_PREFETCH_MARGIN = 600  # pixels below the view to start loading the next batch
+
+# {container: _Sidebar, ...} of the shown sidebars
+_sidebars: weakref.WeakKeyDictionary[ui.column, _Sidebar] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _create_session_menu(sidebar: _Sidebar) -> ui.menu:
+    with ui.menu().classes("text-gray-700") as menu:
+        with ui.menu_item(
+            on_click=lambda: Edit_session_title_clicked.emit(sidebar.session_id),
+        ):
+            with ui.row().classes("items-center"):
+                ui.icon("sym_o_edit").props("color=gray-700 size=20px")
+                ui.label("修改标题")
+        with ui.menu_item(
+            on_click=lambda: Pin_session_clicked.emit(sidebar.session_id),
+        ):
+            with ui.row().classes("items-center"):
+                ui.icon("sym_o_push_pin").props("color=gray-700 size=20px")
+                ui.label("置顶")
+        with ui.menu_item(
+            on_click=lambda: Delete_session_clicked.emit(sidebar.session_id),
+        ):
+            with ui.row().classes("items-center"):
+                ui.icon("sym_o_delete").props("size=20px").classes("text-red-500")
+                ui.label("删除").classes("text-red-500")
+    return menu
+
+
+def _open_session_menu(sidebar: _Sidebar, button: ui.button, session_id: str):
+    """Open the shared context menu at the button of a session row."""
+    sidebar.session_id = session_id
+    if sidebar.menu is None or sidebar.menu.is_deleted:
+        # Built on first use, or again when its row was deleted with it
+        with button:
+            sidebar.menu = _create_session_menu(sidebar)
+    elif sidebar.menu.parent_slot.parent is not button:
+        sidebar.menu.move(target_container=button)
+    sidebar.menu.open()
+
+
+def _create_session_row(session: Session, sidebar: _Sidebar) -> _SessionRow:
+    with ui.row().classes(
+        "w-full items-center no-wrap rounded-lg py-2 pr-2 hover:bg-neutral-200"
+    ) as row:
+        # 1. Main button(link) for loading session
+        with (
+            ui.label(session.title)
+            .classes(
+                "flex-grow min-w-0 rounded-lg pl-2 cursor-pointer "
+                "text-ellipsis no-underline text-gray-600 "
+                "whitespace-nowrap overflow-hidden text-body2 "
+            )
+            .on(
+                "click",
+                lambda e, sid=session.id: History_session_clicked.emit(sid),
+            ) as label
+        ):
+            tooltip = ui.tooltip(session.title).classes("text-caption")
+        # 2. More options button with the shared context menu
+        ui.button(
+            icon="sym_o_more_horiz",
+            on_click=lambda e, sid=session.id: _open_session_menu(
+                sidebar, e.sender, sid
+            ),
+        ).props("flat size=sm round dense color=gray-600").classes(
+            "opacity-0 hover:opacity-100 transition-opacity"
+        )
+    return _SessionRow(row, label, tooltip)
 
 
 def show_session_history(sessions: list[Session], container: ui.column) -> None:
     """
     Show session history in the given container.
 
+    Rows are keyed by session ID and updated in place: only new sessions are
+    created, only changed titles are set, gone sessions are deleted and rows
+    are moved into the new order, so a new chat turn moves a single row. The
+    rows share one context menu, built when it is first opened.
+
     Arguments:
         sessions: A list of Session objects to display.
         container: The UI container where session history will be displayed.
     """
-    container.clear()
-    if not sessions:
-        return
+    sidebar = _sidebars.get(container)
+    children = container.default_slot.children
+    if sidebar is None or any(r.row not in children for r in sidebar.rows.values()):
+        # First show, or the container was cleared elsewhere
+        container.clear()
+        sidebar = _sidebars[container] = _Sidebar()
+    rows = sidebar.rows
 
-    with container:
-        for session in sessions:
-            with ui.row().classes(
-                "w-full items-center no-wrap rounded-lg py-2 pr-2 hover:bg-neutral-200"
-            ):
-                # 1. Main button(link) for loading session
-                with (
-                    ui.label(session.title)
-                    .classes(
-                        "flex-grow min-w-0 rounded-lg pl-2 cursor-pointer "
-                        "text-ellipsis no-underline text-gray-600 "
-                        "whitespace-nowrap overflow-hidden text-body2 "
-                    )
-                    .on(
-                        "click",
-                        lambda e, sid=session.id: History_session_clicked.emit(sid),
-                    )
-                ):
-                    ui.tooltip(session.title).classes("text-caption")
-                # 2. More options button with a context menu
-                with (
-                    ui.button(icon="sym_o_more_horiz")
-                    .props("flat size=sm round dense color=gray-600")
-                    .classes("opacity-0 hover:opacity-100 transition-opacity")
-                ):
-                    with ui.menu().classes("text-gray-700"):
-                        with ui.menu_item(
-                            on_click=lambda e,
-                            i=session.id: Edit_session_title_clicked.emit(i),
-                        ):
-                            with ui.row().classes("items-center"):
-                                ui.icon("sym_o_edit").props("color=gray-700 size=20px")
-                                ui.label("修改标题")
-                        with ui.menu_item(
-                            on_click=lambda e, i=session.id: Pin_session_clicked.emit(
-                                i
-                            ),
-                        ):
-                            with ui.row().classes("items-center"):
-                                ui.icon("sym_o_push_pin").props(
-                                    "color=gray-700 size=20px"
-                                )
-                                ui.label("置顶")
-                        with ui.menu_item(
-                            on_click=lambda e,
-                            i=session.id: Delete_session_clicked.emit(i),
-                        ):
-                            with ui.row().classes("items-center"):
-                                ui.icon("sym_o_delete").props("size=20px").classes(
-                                    "text-red-500"
-                                )
-                                ui.label("删除").classes("text-red-500")
+    keep = {s.id for s in sessions}
+    for session_id in [sid for sid in rows if sid not in keep]:
+        container.remove(rows.pop(session_id).row)
+
+    for index, session in enumerate(sessions):
+        row = rows.get(session.id)
+        if row is None:
+            with container:
+                row = rows[session.id] = _create_session_row(session, sidebar)
+        elif row.label.text != session.title:
+            row.label.set_text(session.title)
+            row.tooltip.set_text(session.title)
+        if children.index(row.row) != index:
+            row.row.move(target_index=index)
 
 
 async def join_history_session(
-    session_id: str, container: ui.column, username: str
-) -> tuple[dict[str, list[str]], list[Message]]:
+    session_id: str, message_list: MessageList
+) -> list[Message]:
     """
-    Join a history session, display its messages in the given container, and
-    return associated citation IDs for the session, organized by query ID.
+    Join a history session, display its latest messages in the given message
+    list, and return the messages of the session.
 
     Arguments:
         session_id: The ID of the session to join.
-        container: The UI container where session messages will be displayed.
-        username: The username of the current user.
+        message_list: The message list where session messages will be displayed.
 
     Returns:
-        A tuple containing:
-            - A dictionary mapping query IDs to lists of citation IDs.
-            - A list of Message objects in the session.
+        A list of Message objects in the session.
     """
-    from ..services import (
-        load_messages_by_session,
-        load_citation_ids_by_session,
-    )
+    from ..services import load_messages_by_session
 
-    container.clear()
-    container.classes(add="flex-grow overflow-y-auto")
+    message_list.container.classes(add="flex-grow overflow-y-auto")
     messages = await load_messages_by_session(session_id)
 
-    with container:
-        for message in messages:
-            if message.role == "user":
-                await display_user_message(
-                    message.content,
-                    username,
-                    message.created_ts,
-                )
-            else:
-                await display_bot_message(message.content)
-                await display_message_footer(
-                    message.id,
-                    message.pair_id,
-                    message.created_ts,
-                    message.likes,
-                    message.dislikes,
-                )
+    queries = {m.id for m in messages if m.role == "user"}
+    turns: list[list[str]] = []
+    missing = []
+    previous = None
+    for message in messages:
+        if message.role == "user":
+            turns.append([message.id])
+        elif message.pair_id != previous and message.pair_id in queries:
+            # A regenerated variant, show the query it answers again
+            turns.append([message.pair_id, message.id])
+        elif turns:
+            turns[-1].append(message.id)
+        else:
+            turns.append([message.id])
+        previous = message.id
+        if (
+            message.role != "user"
+            and message.status != "streaming"
+            and message.formatted is None
+        ):
+            missing.append(message)
+
+    # The saved formatted content is shown as is, formatting only the others
+    await message_list.load(
+        turns, {m.id: m.model_dump() | {"formatted": m.formatted} for m in messages}
+    )
+    await scroll_to_bottom(message_list.container)
+    if missing:
+        asyncio.create_task(_backfill_formatted(missing))
+
+    return messages
+
+
+async def render_message(
+    message: dict, username: str, container: ui.column, saved: bool = True
+):
+    """
+    Display a message of a session in the current context.
+
+    Arguments:
+        message: The message, as a dict of Message fields.
+        username: The username of the current user.
+        container: The scrollable container the message is displayed in.
+        saved: Whether the message is saved, guest messages have no actions.
+    """
+    from ..services import generation_jobs
+
+    message = Message.model_validate(message)
+    if message.role == "user":
+        await display_user_message(message.content, username, message.created_ts)
+        return
+    if message.variant_no:
+        # Shown below the query again, tell the variants apart
+        await display_variant_label(message.variant_no)
 
-    await scroll_to_bottom(container)
+    job = generation_jobs.get(message.id) if message.status == "streaming" else None
+    if job is not None:
+        # Still generating on this worker, attach to its output
+        bot_msg_md = await display_streaming_message()
+        footer_col = ui.column().classes("w-full gap-0")
+        asyncio.create_task(
+            _attach_generation(job, message, bot_msg_md, footer_col, container)
+        )
+        return
+
+    content = message.content
+    if message.status == "streaming":
+        # Checkpointed while streaming, the generation is still going on
+        # elsewhere or the worker was gone
+        content += "\n\n> **[回答生成中或已中断]**"
+        await display_bot_message(content)
+    else:
+        await display_bot_message(content, message.formatted)
+    await display_message_footer(
+        saved and message.id,
+        saved and message.pair_id,
+        message.created_ts,
+        message.likes,
+        message.dislikes,
+    )
 
-    return await load_citation_ids_by_session(session_id), messages
+
+async def _backfill_formatted(messages: list[Message]):
+    """Format and save responses saved before formatted content was kept."""
+    from ..services import save_formatted_messages
+
+    formatted = {m.id: await format_markdown(m.content) for m in messages}
+    await save_formatted_messages(formatted)
+
+
+async def _attach_generation(
+    job: "StreamJob",
+    message: Message,
+    bot_msg_md: "StreamingMarkdown",
+    footer_col: ui.column,
+    container: ui.column,
+):
+    """Replay and follow a running generation, then add the message footer."""
+    await follow_generation(bot_msg_md, job, container)
+    with footer_col:
+        await display_message_footer(
+            message.id,
+            message.pair_id,
+            job.finished_ts,
+            message.likes,
+            message.dislikes,
+        )
 
 
 async def session_browser(user_id: str):
@@ -144,31 +303,61 @@ async def session_browser(user_id: str):
         return
 
     from ..services import next_session_batch, search_result_batch
-    from ..constants import SCROLL_TO_BOTTOM_JS
+    from ..constants import LOAD_MORE_OBSERVER_JS
 
     retriever = None
     session_ids = None
 
     last_session_id = None
+    sentinel = None
+    loading = False
+
+    def arm_sentinel():
+        """(Re)create the sentinel at the end of the list and observe it."""
+        nonlocal sentinel
+        if sentinel is None or sentinel.is_deleted:
+            with browser_card:
+                sentinel = ui.element("div").classes("w-full h-px shrink-0")
+            sentinel.on("loadmore", load_more)
+        else:
+            sentinel.move(target_index=-1)
+        ui.run_javascript(
+            LOAD_MORE_OBSERVER_JS.format(
+                sentinel_id=sentinel.id,
+                root_id="scrollable-card",
+                margin=_PREFETCH_MARGIN,
+            )
+        )
 
     # session_brief_batch as: [(id, title, user_id, created_ts, content), ...]
-    async def check():
-        nonlocal last_session_id
+    async def load_more():
+        nonlocal last_session_id, loading
+        if loading or sentinel is None:
+            return  # one batch in flight at most
+        loading = True
+        current = sentinel
         try:
-            if await ui.run_javascript(SCROLL_TO_BOTTOM_JS):
-                batch = await next_session_batch(user_id, last_session_id, 10)
-                if batch:
-                    last_session_id = batch[-1][0]
-                    with browser_card:
-                        await show_batch(batch)
-                else:
-                    tmr.deactivate()
-                    with browser_card:
-                        ui.label("没有更多对话了").classes(
-                            "mx-auto text-gray-500 py-4 text-caption"
-                        )
-        except TimeoutError:
-            pass  # client might have disconnected
+            batch = await next_session_batch(user_id, last_session_id, _BATCH_SIZE)
+        finally:
+            loading = False
+        if sentinel is not current:
+            return  # switched to search results or cleared meanwhile
+        if batch:
+            last_session_id = batch[-1][0]
+            await show_batch(batch)
+            arm_sentinel()
+        else:
+            stop_loading()
+            with browser_card:
+                ui.label("没有更多对话了").classes(
+                    "mx-auto text-gray-500 py-4 text-caption"
+                )
+
+    def stop_loading():
+        nonlocal sentinel
+        if sentinel is not None and not sentinel.is_deleted:
+            browser_card.remove(sentinel)
+        sentinel = None
 
     async def show_batch(batch: list[dict]):
         with browser_card:
@@ -236,11 +425,10 @@ async def session_browser(user_id: str):
         )
 
     s_dialog.open()
-    tmr = ui.timer(0.1, check)
+    arm_sentinel()
 
     async def session_clicked_callback(session_id: str):
         s_dialog.close()
-        tmr.deactivate()
         History_session_clicked.emit(session_id)
 
     async def search_clicked_callback():
@@ -252,7 +440,7 @@ async def session_browser(user_id: str):
             return
         nonlocal retriever, session_ids
 
-        tmr.deactivate()
+        stop_loading()
         browser_card.clear()
         search_inp.disable()
         with browser_card:
@@ -282,5 +470,6 @@ async def session_browser(user_id: str):
         nonlocal last_session_id
         search_inp.set_value(None)
         last_session_id = None
+        stop_loading()
         browser_card.clear()
-        tmr.activate()
+        arm_sentinel()
@@ -0,0 +1,108 @@
+import json
+
+from .rendering import render_pool
+
+from nicegui import ui
+
+_TAIL_CLASS = "nicegui-stream-tail"
+
+# Insert the HTML of newly completed blocks before the tail, replace the tail
+_DELTA_JS = """
+(() => {{
+  const el = getHtmlElement({id});
+  if (!el) return;
+  let tail = el.querySelector(":scope > .{tail_class}");
+  if (!tail) {{
+    tail = document.createElement("div");
+    tail.className = "{tail_class}";
+    el.appendChild(tail);
+  }}
+  const appended = {appended};
+  if (appended) tail.insertAdjacentHTML("beforebegin", appended);
+  tail.innerHTML = {tail};
+}})()
+"""
+
+
+def _block_boundary(text: str, start: int) -> int:
+    """The end of the last complete block in `text`, searching from `start`."""
+    boundary = start
+    in_fence = False
+    pos = start
+    for line in text[start:].splitlines(keepends=True):
+        pos += len(line)
+        stripped = line.strip()
+        if stripped.startswith(("```", "~~~")):
+            in_fence = not in_fence
+        elif not stripped and not in_fence and line.endswith("\n"):
+            boundary = pos
+    return boundary
+
+
+class StreamingMarkdown(ui.markdown):
+    """
+    A markdown element for text that grows while it streams.
+
+    Blocks ended by a blank line outside of a code fence do not change
+    anymore, they are formatted and converted to HTML once, in the render
+    pool like the unfinished tail. `stream` sends only the HTML of newly
+    completed blocks and of the unfinished tail to the browser. The element
+    props are kept in sync without being sent, so a reconnecting client still
+    gets the whole text, and `finish` sends the final content in full.
+    """
+
+    def __init__(self, content: str = "", **kwargs):
+        super().__init__(content, **kwargs)
+        self._stable = 0  # length of the source converted and sent
+        self._html = ""
+        self._streaming = False
+
+    def _to_html(self, text: str) -> str:
+        import mdformat
+        from nicegui.elements.markdown import prepare_content
+
+        if not text.strip():
+            return ""
+        return prepare_content(mdformat.text(text), extras=" ".join(self.extras))
+
+    def _convert(self, text: str) -> tuple[int, str, str]:
+        boundary = max(_block_boundary(text, self._stable), self._stable)
+        return (
+            boundary,
+            self._to_html(text[self._stable : boundary]),
+            self._to_html(text[boundary:]),
+        )
+
+    async def stream(self, text: str) -> None:
+        """Show the text streamed so far, sending only what has changed."""
+        boundary, appended, tail = await render_pool.run(self._convert, text)
+        self._html += appended
+        self._stable = boundary
+
+        with self._props.suspend_updates():
+            # Kept for a full sync, setting the prop would send it right away
+            self._props["innerHTML"] = (
+                f'{self._html}<div class="{_TAIL_CLASS}">{tail}</div>'
+            )
+        if not self._streaming:
+            # The browser shows something else, e.g. a notice, sync in full
+            self._streaming = True
+            self.update()
+            return
+        self.client.run_javascript(
+            _DELTA_JS.format(
+                id=self.id,
+                tail_class=_TAIL_CLASS,
+                appended=json.dumps(appended),
+                tail=json.dumps(tail),
+            )
+        )
+
+    def finish(self, content: str) -> None:
+        """Show the final content, sent in full."""
+        self._stable, self._html, self._streaming = 0, "", False
+        if self.content == content:
+            # The content property does not change, convert and send anyway
+            self._handle_content_change(content)
+        else:
+            self.set_content(content)
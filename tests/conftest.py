@@ -0,0 +1,20 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import yaml
+
+# hurag_webui reads webui-config.yaml from the working directory on import,
+# run the tests from a scratch directory with the template filled in unless
+# a config is at hand already
+if not (Path.cwd() / "webui-config.yaml").exists():
+    root = Path(__file__).resolve().parent.parent
+    workdir = Path(tempfile.mkdtemp(prefix="hurag_webui-tests-"))
+    config = yaml.safe_load((root / "webui-config_template.yaml").read_text("utf-8"))
+    config["mariadb"] |= {"user": "test", "password": "test"}
+    (workdir / "webui-config.yaml").write_text(yaml.safe_dump(config), "utf-8")
+    for name in ("hurag.yaml", ".env", ".webui.env"):
+        if (Path.cwd() / name).exists():
+            shutil.copy(Path.cwd() / name, workdir / name)
+    os.chdir(workdir)
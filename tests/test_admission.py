@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from hurag_webui.runtime import AdmissionController, AdmissionRejected, AdmissionTimeout
+
+
+def test_limits_concurrency():
+    async def run():
+        controller = AdmissionController("test", 2, max_queue=10, timeout=5)
+        active, peak = 0, 0
+
+        async def request():
+            nonlocal active, peak
+            async with controller.slot():
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*(request() for _ in range(6)))
+        return controller, peak
+
+    controller, peak = asyncio.run(run())
+    assert peak == 2
+    assert controller.admitted == 6
+    assert controller.stats()["active"] == 0
+
+
+def test_fair_queuing_admits_light_keys_first():
+    async def run():
+        controller = AdmissionController("test", 1, max_queue=10, timeout=5)
+        order = []
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot(key="heavy"):
+                await release.wait()
+
+        async def request(key):
+            async with controller.slot(key=key):
+                order.append(key)
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        # The heavy key queues three requests before the light one arrives
+        tasks = [asyncio.create_task(request("heavy")) for _ in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("light")))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(holder, *tasks)
+        return order
+
+    order = asyncio.run(run())
+    assert order.index("light") < 2
+
+
+def test_weight_shortens_the_virtual_finish():
+    async def run():
+        controller = AdmissionController("test", 1, max_queue=10, timeout=5)
+        order = []
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot():
+                await release.wait()
+
+        async def request(key, weight):
+            async with controller.slot(key=key, weight=weight, cost=10):
+                order.append(key)
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        tasks = [
+            asyncio.create_task(request("normal", 1.0)),
+            asyncio.create_task(request("premium", 4.0)),
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(holder, *tasks)
+        return order
+
+    assert asyncio.run(run()) == ["premium", "normal"]
+
+
+def test_rejects_when_the_queue_is_full():
+    async def run():
+        controller = AdmissionController("test", 1, max_queue=1, timeout=5)
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            async with controller.slot():
+                pass
+        release.set()
+        await asyncio.gather(holder, waiting)
+        return controller
+
+    controller = asyncio.run(run())
+    assert controller.rejected == 1
+    assert controller.admitted == 2
+
+
+def test_times_out_in_the_queue_and_reports_positions():
+    async def run():
+        controller = AdmissionController("test", 1, max_queue=5, timeout=0.05)
+        release = asyncio.Event()
+        positions = []
+
+        async def hold():
+            async with controller.slot():
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionTimeout):
+            async with controller.slot(on_wait=positions.append):
+                pass
+        release.set()
+        await holder
+        return controller, positions
+
+    controller, positions = asyncio.run(run())
+    assert positions == [1]
+    assert controller.timeouts == 1
+    assert controller.stats()["queue_depth"] == 0
+    assert controller.stats()["active"] == 0
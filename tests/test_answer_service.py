@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+
+from hurag_webui.services import answer_service
+from hurag_webui.services.answer_service import lookup_answer, store_answer
+
+
+def _knowledge(segment_id: str, content: str):
+    return SimpleNamespace(segment_id=segment_id, content=content)
+
+
+def _fake_knowledge_base(monkeypatch, load):
+    import hurag.knowledge_base
+
+    monkeypatch.setattr(hurag.knowledge_base, "get_knowledge_by_segment_ids", load)
+
+
+def test_lookup_answer_hit_and_invalidation(monkeypatch):
+    segments = {"s1": _knowledge("s1", "原文")}
+
+    async def load(ids, user_path):
+        return [segments[i] for i in ids if i in segments]
+
+    _fake_knowledge_base(monkeypatch, load)
+    answer_service._answer_cache.clear()
+
+    async def run():
+        await store_answer("问题", "mix", "/org", "答案", [(segments["s1"], 0.8)])
+        hit = await lookup_answer("问题", "mix", "/org")
+        segments["s1"] = _knowledge("s1", "修改后的原文")
+        miss = await lookup_answer("问题", "mix", "/org")
+        return hit, miss
+
+    hit, miss = asyncio.run(run())
+    assert hit[0] == "答案" and hit[1][0][1] == 0.8
+    assert miss is None
+
+
+def test_lookup_answer_treats_load_errors_as_a_miss(monkeypatch):
+    async def load(ids, user_path):
+        raise RuntimeError("database gone")
+
+    _fake_knowledge_base(monkeypatch, load)
+    answer_service._answer_cache.clear()
+
+    async def run():
+        knowledge_list = [(_knowledge("s1", "原文"), 1.0)]
+        await store_answer("问题", "mix", "/org", "答案", knowledge_list)
+        return await lookup_answer("问题", "mix", "/org")
+
+    assert asyncio.run(run()) is None
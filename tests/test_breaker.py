@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from hurag_webui.runtime import CircuitBreaker, CircuitOpen, breaker
+
+
+class FakeTime:
+    now = 1000.0
+
+    @classmethod
+    def monotonic(cls) -> float:
+        return cls.now
+
+
+@pytest.fixture
+def fake_time(monkeypatch):
+    monkeypatch.setattr(breaker, "time", FakeTime)
+
+
+async def _ok():
+    return "ok"
+
+
+async def _fail():
+    raise ConnectionError("down")
+
+
+def _call(circuit: CircuitBreaker, factory):
+    return asyncio.run(circuit.call(factory))
+
+
+def _trip(circuit: CircuitBreaker) -> None:
+    for _ in range(circuit.min_calls):
+        with pytest.raises(ConnectionError):
+            _call(circuit, _fail)
+
+
+def test_opens_on_the_failure_ratio(fake_time):
+    circuit = CircuitBreaker("test", timeout=0, min_calls=4, failure_ratio=0.5)
+    _call(circuit, _ok)
+    _call(circuit, _ok)
+    with pytest.raises(ConnectionError):
+        _call(circuit, _fail)
+    assert circuit.state == "closed"
+    with pytest.raises(ConnectionError):
+        _call(circuit, _fail)
+    assert circuit.state == "open"
+    with pytest.raises(CircuitOpen):
+        _call(circuit, _ok)
+    assert circuit.rejected == 1
+
+
+def test_half_open_probe_closes_the_circuit(fake_time):
+    circuit = CircuitBreaker("test", timeout=0, min_calls=2, reset_timeout=30)
+    _trip(circuit)
+    FakeTime.now += 31
+    assert not circuit.is_open
+    assert _call(circuit, _ok) == "ok"
+    assert circuit.state == "closed"
+    assert _call(circuit, _ok) == "ok"
+
+
+def test_failed_probe_opens_the_circuit_again(fake_time):
+    circuit = CircuitBreaker("test", timeout=0, min_calls=2, reset_timeout=30)
+    _trip(circuit)
+    FakeTime.now += 31
+    with pytest.raises(ConnectionError):
+        _call(circuit, _fail)
+    assert circuit.state == "open"
+    assert circuit.opened == 2
+    with pytest.raises(CircuitOpen):
+        _call(circuit, _ok)
+
+
+def test_half_open_lets_a_limited_number_of_probes_through(fake_time):
+    circuit = CircuitBreaker(
+        "test", timeout=0, min_calls=2, reset_timeout=30, half_open_calls=1
+    )
+    _trip(circuit)
+    FakeTime.now += 31
+
+    async def run():
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+            return "ok"
+
+        probe = asyncio.create_task(circuit.call(slow))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitOpen):
+            await circuit.call(_ok)
+        release.set()
+        return await probe
+
+    assert asyncio.run(run()) == "ok"
+    assert circuit.state == "closed"
+
+
+def test_timeouts_count_as_failures():
+    circuit = CircuitBreaker("test", timeout=0.01, min_calls=1)
+
+    async def hang():
+        await asyncio.sleep(1)
+
+    with pytest.raises(TimeoutError):
+        _call(circuit, hang)
+    assert circuit.state == "open"
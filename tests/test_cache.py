@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from hurag_webui.runtime import TTLCache, cache
+
+
+class FakeTime:
+    now = 1000.0
+
+    @classmethod
+    def monotonic(cls) -> float:
+        return cls.now
+
+
+def test_get_or_load_coalesces_concurrent_loads():
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def run():
+        c = TTLCache(maxsize=8, ttl=60)
+        values = await asyncio.gather(*(c.get_or_load("k", loader) for _ in range(5)))
+        return c, values
+
+    c, values = asyncio.run(run())
+    assert values == ["value"] * 5
+    assert calls == [1]
+    assert c.coalesced == 4
+    assert c.get("k") == "value"
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    monkeypatch.setattr(cache, "time", FakeTime)
+    c = TTLCache(maxsize=8, ttl=10)
+    c.set("k", "value")
+    FakeTime.now += 9
+    assert c.get("k") == "value"
+    FakeTime.now += 2
+    assert c.get("k") is None
+    assert len(c) == 0
+
+
+def test_lru_eviction():
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert c.get("a") == 1
+    assert c.get("b") is None
+
+
+def test_cancelled_caller_does_not_cancel_coalesced_waiters():
+    async def loader():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def run():
+        c = TTLCache(maxsize=8, ttl=60)
+        first = asyncio.create_task(c.get_or_load("k", loader))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(c.get_or_load("k", loader))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return c, await second
+
+    c, value = asyncio.run(run())
+    assert value == "value"
+    assert c.get("k") == "value"
+
+
+def test_failed_load_is_not_cached_and_can_be_retried():
+    attempts = []
+
+    async def loader():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ValueError("boom")
+        return "value"
+
+    async def run():
+        c = TTLCache(maxsize=8, ttl=60)
+        with pytest.raises(ValueError):
+            await c.get_or_load("k", loader)
+        return await c.get_or_load("k", loader)
+
+    assert asyncio.run(run()) == "value"
+    assert len(attempts) == 2
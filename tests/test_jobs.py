@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from hurag_webui.runtime import JobRegistry
+
+
+async def _stream(job, chunks=3):
+    for i in range(chunks):
+        job.append(f"{i}")
+        await asyncio.sleep(0.01)
+    return "complete"
+
+
+def test_followers_get_the_whole_output():
+    async def run():
+        registry = JobRegistry()
+        job = registry.start("k", _stream)
+        late = []
+        received = [delta async for delta in job.follow()]
+        async for delta in job.follow(offset=1):
+            late.append(delta)
+        return job, "".join(received), "".join(late)
+
+    job, received, late = asyncio.run(run())
+    assert job.status == "complete"
+    assert received == "012"
+    assert late == "12"
+
+
+def test_stop_finishes_the_job_as_aborted():
+    async def run():
+        registry = JobRegistry()
+        job = registry.start("k", lambda job: asyncio.sleep(10))
+        await asyncio.sleep(0)
+        job.cancel()
+        return job, await job.wait()
+
+    job, status = asyncio.run(run())
+    assert job.stopped
+    assert status == "aborted"
+    assert not job.task.cancelled()
+
+
+def test_other_cancellations_propagate():
+    async def run():
+        registry = JobRegistry()
+        job = registry.start("k", lambda job: asyncio.sleep(10))
+        await asyncio.sleep(0)
+        job.task.cancel()  # e.g. the worker shutting down
+        with pytest.raises(asyncio.CancelledError):
+            await job.task
+        return job
+
+    job = asyncio.run(run())
+    assert not job.stopped
+    assert job.status == "aborted"
+
+
+def test_finished_jobs_linger():
+    async def run():
+        registry = JobRegistry(linger=0)
+        job = registry.start("k", _stream)
+        await job.wait()
+        return registry, job
+
+    registry, job = asyncio.run(run())
+    job.finished -= 1
+    assert registry.get("k") is None
+    assert registry.stats()["started"] == 1
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+from nicegui import Client, core, ui
+
+from hurag_webui.viewers.message_list import MessageList
+
+TURNS = 50
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Set to the running loop by _run, restored after the test
+    monkeypatch.setattr(core, "loop", None)
+    return Client(ui.page("/"))
+
+
+def _messages() -> dict[str, dict]:
+    return {f"m{i}": {"id": f"m{i}"} for i in range(TURNS)}
+
+
+def _message_list(client: Client, rendered: list[str]) -> MessageList:
+    messages = _messages()
+
+    async def source(message_ids):
+        return {i: messages[i] for i in message_ids}
+
+    async def render(message):
+        rendered.append(message["id"])
+
+    with client:
+        container = ui.column()
+    return MessageList(container, source, render, max_live=10, page=5)
+
+
+def _run(client: Client, coro):
+    async def run():
+        core.loop = asyncio.get_running_loop()
+        with client:
+            return await coro
+
+    return asyncio.run(run())
+
+
+def _live(message_list: MessageList) -> list[str]:
+    return [
+        turn.message_ids[0]
+        for turn in message_list._turns
+        if turn.column is not None
+    ]
+
+
+def test_load_builds_only_the_latest_turns(client):
+    rendered = []
+    message_list = _message_list(client, rendered)
+    _run(client, message_list.load([[f"m{i}"] for i in range(TURNS)], _messages()))
+    assert (message_list._start, message_list._end) == (40, 50)
+    assert rendered == [f"m{i}" for i in range(40, 50)]
+    assert _live(message_list) == rendered
+    assert message_list._top is not None and message_list._bottom is None
+
+
+def test_scrolling_up_evicts_the_bottom_turns(client):
+    rendered = []
+    message_list = _message_list(client, rendered)
+
+    async def scroll_up():
+        await message_list.load([[f"m{i}"] for i in range(TURNS)], _messages())
+        await message_list._load_above()
+
+    _run(client, scroll_up())
+    assert (message_list._start, message_list._end) == (35, 45)
+    assert _live(message_list) == [f"m{i}" for i in range(35, 45)]
+    assert message_list._bottom is not None
+
+
+def test_scrolling_back_down_evicts_the_top_turns(client):
+    rendered = []
+    message_list = _message_list(client, rendered)
+
+    async def scroll_up_and_down():
+        await message_list.load([[f"m{i}"] for i in range(TURNS)], _messages())
+        await message_list._load_above()
+        await message_list._load_above()
+        await message_list._load_below()
+
+    _run(client, scroll_up_and_down())
+    assert (message_list._start, message_list._end) == (35, 45)
+    assert _live(message_list) == [f"m{i}" for i in range(35, 45)]
+    # Evicted turns are built again from the source
+    assert rendered.count("m40") == 2
+
+
+def test_new_turn_jumps_back_to_the_end(client):
+    rendered = []
+    message_list = _message_list(client, rendered)
+
+    async def scroll_up_and_send():
+        await message_list.load([[f"m{i}"] for i in range(TURNS)], _messages())
+        await message_list._load_above()
+        await message_list._load_above()
+        column = await message_list.new_turn()
+        message_list.record(column, ["new"])
+
+    _run(client, scroll_up_and_send())
+    assert message_list._end == len(message_list._turns) == TURNS + 1
+    assert message_list._end - message_list._start <= message_list.max_live
+    assert _live(message_list)[-1] == "new"
+    assert message_list._bottom is None
@@ -0,0 +1,83 @@
+from datetime import date
+from types import SimpleNamespace
+
+from hurag_webui.prompts import count_tokens, pack_prompt
+
+
+def _knowledge(segment_id: str, content: str):
+    metadata = SimpleNamespace(
+        title=f"文档{segment_id}",
+        sn=None,
+        date=date(2024, 1, 1),
+        valid_from=date(2024, 1, 1),
+        valid_to=None,
+        replaces=None,
+        localizes=None,
+        pub_path="/org",
+    )
+    return SimpleNamespace(segment_id=segment_id, content=content, metadata=metadata)
+
+
+def _history(turns: int) -> list[dict[str, str]]:
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"问题{i} " + "问" * 50})
+        history.append({"role": "assistant", "content": f"回答{i} " + "答" * 50})
+    return history
+
+
+def test_count_tokens():
+    assert count_tokens(None) == 0
+    assert count_tokens("") == 0
+    assert count_tokens("你好") == 2
+    assert count_tokens("hello") == 2  # ceil(5 / 4)
+    assert count_tokens("RAG 检索。") == 4
+
+
+def test_pack_prompt_keeps_within_budget():
+    knowledge = [(_knowledge(str(i), "知识" * 200), 0.5) for i in range(10)]
+    for budget in (600, 1500, 4000):
+        prompt, history, tokens = pack_prompt(
+            "问题", knowledge, _history(10), budget, system_prompt="系统"
+        )
+        assert tokens <= budget
+        assert count_tokens(prompt) + sum(
+            count_tokens(m["content"]) for m in history
+        ) <= budget
+
+
+def test_pack_prompt_prefers_the_best_segments():
+    knowledge = [
+        (_knowledge("low", "低分" * 300), 0.1),
+        (_knowledge("high", "高分" * 300), 0.9),
+    ]
+    prompt, _, _ = pack_prompt("问题", knowledge, [], 1200)
+    assert "文档high" in prompt
+    assert "文档low" not in prompt or prompt.index("文档high") < prompt.index(
+        "文档low"
+    )
+
+
+def test_pack_prompt_truncates_the_overflowing_segment():
+    knowledge = [(_knowledge("long", "长" * 5000), 0.9)]
+    prompt, _, tokens = pack_prompt("问题", knowledge, [], 1000)
+    assert "文档long" in prompt
+    assert "长……" in prompt
+    assert tokens <= 1000
+
+
+def test_pack_prompt_keeps_the_most_recent_history():
+    history = _history(20)
+    _, packed, _ = pack_prompt("问题", None, history, 500)
+    assert packed
+    assert packed == history[-len(packed) :]
+    assert packed[0]["role"] == "user"
+
+
+def test_pack_prompt_pins_system_messages():
+    summary = {"role": "system", "content": "摘要" * 20}
+    history = [summary] + _history(20)
+    _, packed, tokens = pack_prompt("问题", None, history, 500)
+    assert packed[0] == summary
+    assert packed[1:] == history[-(len(packed) - 1) :]
+    assert tokens <= 500
@@ -0,0 +1,65 @@
+import pytest
+
+from hurag_webui.runtime import QuotaManager, quota
+
+
+class FakeTime:
+    now = 1000.0
+
+    @classmethod
+    def monotonic(cls) -> float:
+        return cls.now
+
+
+@pytest.fixture(autouse=True)
+def fake_time(monkeypatch):
+    monkeypatch.setattr(quota, "time", FakeTime)
+
+
+def test_charge_puts_a_user_in_debt_until_the_bucket_refills():
+    manager = QuotaManager(tokens_per_minute=600, burst=600)
+    key, weight = manager.identify("alice", "/org/a")
+    assert (key, weight) == ("alice", 1.0)
+    assert manager.delay(key) == 0
+
+    manager.charge(key, 900)  # 300 tokens in debt, refilled at 10 per second
+    assert manager.delay(key) == pytest.approx(30)
+    FakeTime.now += 20
+    assert manager.delay(key) == pytest.approx(10)
+    FakeTime.now += 10
+    assert manager.delay(key) == 0
+    assert manager.usage == {"alice": 900}
+    assert manager.throttled == 2
+
+
+def test_bucket_does_not_exceed_its_capacity():
+    manager = QuotaManager(tokens_per_minute=600, burst=600)
+    key, _ = manager.identify("alice", "/org/a")
+    FakeTime.now += 3600
+    manager.charge(key, 601)
+    assert manager.delay(key) == pytest.approx(0.1)
+
+
+def test_overrides_set_budget_and_weight():
+    manager = QuotaManager(
+        tokens_per_minute=600,
+        burst=600,
+        overrides={"vip": 2400, "/org/lab": 1200},
+    )
+    assert manager.identify("vip", "/org/a") == ("vip", 4.0)
+    assert manager.identify("bob", "/org/lab/x") == ("bob", 2.0)
+    assert manager.identify("carol", "/org/b") == ("carol", 1.0)
+
+
+def test_user_path_scope_shares_a_bucket():
+    manager = QuotaManager(tokens_per_minute=600, burst=600, scope="user_path")
+    key, _ = manager.identify("alice", "/org/a")
+    assert manager.identify("bob", "/org/a")[0] == key == "/org/a"
+
+
+def test_disabled_quota_never_delays():
+    manager = QuotaManager(tokens_per_minute=0, burst=0)
+    key, weight = manager.identify("alice", "/org/a")
+    manager.charge(key, 10**6)
+    assert weight == 1.0
+    assert manager.delay(key) == 0
@@ -0,0 +1,119 @@
+import asyncio
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+from hurag_webui import conf
+from hurag_webui.runtime import CircuitBreaker
+from hurag_webui.services import retrieval_service
+from hurag_webui.services.retrieval_service import (
+    dedup_knowledge,
+    retrieve_knowledge,
+    select_mode,
+)
+
+
+def test_retrieve_knowledge_records_latency_and_caches(monkeypatch):
+    calls = []
+
+    async def fake_retrieve(query, history, mode, user_path):
+        calls.append((query, mode))
+        return [("knowledge", 0.9)]
+
+    monkeypatch.setattr(retrieval_service, "retrieve", fake_retrieve)
+    monkeypatch.setattr(retrieval_service, "_mode_latency", {})
+    retrieval_service._retrieval_cache.clear()
+
+    async def run():
+        first = await retrieve_knowledge("什么是 RAG", [], "mix", "/org")
+        second = await retrieve_knowledge("什么是  rag", [], "mix", "/org")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second == [("knowledge", 0.9)]
+    assert calls == [("什么是 RAG", "mix")]  # the second is a cache hit
+    assert len(retrieval_service._mode_latency["mix"]) == 1
+
+
+def test_retrieve_knowledge_daily_mode():
+    assert asyncio.run(retrieve_knowledge("你好", [], None, "/org")) == []
+
+
+def test_select_mode_keeps_fast_mode(monkeypatch):
+    monkeypatch.setattr(retrieval_service, "_mode_latency", {})
+    assert select_mode("global") == "global"
+    assert select_mode(None) is None
+
+
+def test_select_mode_downgrades_slow_mode(monkeypatch):
+    monkeypatch.setattr(retrieval_service, "_mode_latency", {})
+    monkeypatch.setattr(conf.retrieval, "latency_budget", 1)
+    for _ in range(retrieval_service._MIN_SAMPLES):
+        retrieval_service._record_latency("global", 5.0)
+    assert select_mode("global") == "community"
+
+
+def test_select_mode_downgrades_on_queue_depth(monkeypatch):
+    class Admission:
+        queue_depth = 100
+
+    monkeypatch.setattr(retrieval_service, "_mode_latency", {})
+    monkeypatch.setattr(conf.retrieval, "downgrade_queue_depth", 20)
+    monkeypatch.setattr(retrieval_service, "llm_admission", Admission())
+    assert select_mode("global") == "naive"
+
+
+def test_retrieve_knowledge_records_failures_as_timeouts(monkeypatch):
+    async def failing_retrieve(query, history, mode, user_path):
+        raise ConnectionError("backend down")
+
+    breaker = CircuitBreaker("retrieval", timeout=20, min_calls=100)
+    monkeypatch.setattr(retrieval_service, "retrieve", failing_retrieve)
+    monkeypatch.setattr(retrieval_service, "retrieval_breaker", breaker)
+    monkeypatch.setattr(retrieval_service, "_mode_latency", {})
+    monkeypatch.setattr(conf.retrieval, "latency_budget", 1)
+    retrieval_service._retrieval_cache.clear()
+
+    for _ in range(retrieval_service._MIN_SAMPLES):
+        with pytest.raises(ConnectionError):
+            asyncio.run(retrieve_knowledge("慢查询", [], "global", "/org"))
+    (_, seconds), *_ = retrieval_service._mode_latency["global"]
+    assert seconds == 20
+    assert select_mode("global") == "community"
+
+
+def _segment(segment_id, content, valid_from, valid_to=None):
+    metadata = SimpleNamespace(
+        valid_from=valid_from, date=valid_from, valid_to=valid_to
+    )
+    return SimpleNamespace(segment_id=segment_id, content=content, metadata=metadata)
+
+
+REGULATION = "第一条 为了规范知识库的管理和使用，保障数据安全，制定本办法。" * 3
+
+
+def test_dedup_knowledge_keeps_the_newest_valid_version():
+    old = _segment("old", REGULATION, date(2020, 1, 1), valid_to=date(2024, 1, 1))
+    new = _segment("new", REGULATION + "（修订）", date(2024, 1, 1))
+    other = _segment("other", "完全不同的另一段内容，讨论的是别的主题。" * 3, date(2019, 1, 1))
+
+    result = dedup_knowledge([(old, 0.9), (new, 0.7), (other, 0.5)], threshold=0.8)
+    assert [k.segment_id for k, _ in result] == ["new", "other"]
+    assert result[0][1] == 0.9  # the best score of the group
+
+
+def test_dedup_knowledge_prefers_newer_among_valid_versions():
+    first = _segment("2021", REGULATION, date(2021, 1, 1))
+    second = _segment("2023", REGULATION, date(2023, 1, 1))
+    result = dedup_knowledge([(first, 0.8), (second, 0.6)], threshold=0.8)
+    assert [k.segment_id for k, _ in result] == ["2023"]
+
+
+def test_dedup_knowledge_disabled_or_distinct():
+    a = _segment("a", REGULATION, date(2021, 1, 1))
+    b = _segment("b", REGULATION, date(2023, 1, 1))
+    items = [(a, 0.8), (b, 0.6)]
+    assert dedup_knowledge(items, threshold=0) == items
+    assert len(dedup_knowledge(items, threshold=1.01)) == 2
+    assert len(items) == 2  # the input is left as is
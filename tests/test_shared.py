@@ -0,0 +1,87 @@
+import asyncio
+import os
+
+from hurag_webui.runtime import SharedState, shared
+
+
+class FakeTime:
+    now = 1000.0
+
+    @classmethod
+    def time(cls) -> float:
+        return cls.now
+
+
+def test_values_expire(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared, "time", FakeTime)
+    state = SharedState("test", path=str(tmp_path / "shared.db"))
+
+    async def run():
+        await state.set_many("ns", {"a": {"x": 1}, "b": [1, 2]}, ttl=10)
+        found = await state.get_many("ns", ["a", "b", "c"])
+        FakeTime.now += 11
+        expired = await state.get("ns", "a")
+        await state.stop()
+        return found, expired
+
+    found, expired = asyncio.run(run())
+    assert found == {"a": {"x": 1}, "b": [1, 2]}
+    assert expired is None
+    assert (state.hits, state.misses) == (2, 2)
+
+
+def test_delete_and_namespaces(tmp_path):
+    state = SharedState("test", path=str(tmp_path / "shared.db"))
+
+    async def run():
+        await state.set("ns", "k", "value", ttl=60)
+        other = await state.get("other", "k")
+        await state.delete("ns", "k")
+        deleted = await state.get("ns", "k")
+        await state.stop()
+        return other, deleted
+
+    assert asyncio.run(run()) == (None, None)
+
+
+def test_events_reach_local_subscribers_at_once(tmp_path):
+    state = SharedState("test", path=str(tmp_path / "shared.db"))
+    received = []
+
+    async def run():
+        unsubscribe = state.subscribe("topic", received.append)
+        await state.publish("topic", {"n": 1})
+        unsubscribe()
+        await state.publish("topic", {"n": 2})
+        await state.stop()
+
+    asyncio.run(run())
+    assert received == [{"n": 1}]
+
+
+def test_events_of_other_processes_are_polled(tmp_path):
+    path = str(tmp_path / "shared.db")
+    state = SharedState("test", path=path, poll_interval=0.01)
+    received = []
+
+    async def run():
+        state.subscribe("topic", received.append)
+        await state.start()
+        # Published by another worker process
+        await state._run(
+            lambda conn: conn.execute(
+                "INSERT INTO events (topic, payload, pid, ts) VALUES (?, ?, ?, ?)",
+                ("topic", '{"n": 1}', os.getpid() + 1, 0),
+            )
+        )
+        await state.publish("topic", {"n": 2})  # dispatched once, when published
+        for _ in range(50):
+            if len(received) >= 2:
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        await state.stop()
+
+    asyncio.run(run())
+    assert sorted(e["n"] for e in received) == [1, 2]
+    assert state.received == 1
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Mount, Route
+from starlette.testclient import TestClient
+
+from hurag_webui.runtime import PrecompressedStatic, SelectiveGZipMiddleware
+from hurag_webui.runtime import static
+
+TEXT = "body { color: #333; }\n" * 200
+
+
+@pytest.fixture
+def static_files(tmp_path):
+    (tmp_path / "app.css").write_text(TEXT)
+    (tmp_path / "noise.bin").write_bytes(os.urandom(4096))  # incompressible
+    return PrecompressedStatic(str(tmp_path))
+
+
+@pytest.fixture
+def client(static_files):
+    async def api(request):
+        return PlainTextResponse(TEXT)
+
+    app = Starlette(
+        routes=[Route("/api", api), Mount("/static", static_files)],
+    )
+    app.add_middleware(
+        SelectiveGZipMiddleware, minimum_size=1000, exclude=("/static/",)
+    )
+    return TestClient(app)
+
+
+def _get(client, path, encoding, **headers):
+    return client.get(path, headers={"accept-encoding": encoding, **headers})
+
+
+def test_negotiates_the_content_coding(client):
+    identity = _get(client, "/static/app.css", "identity")
+    gzipped = _get(client, "/static/app.css", "gzip")
+    assert "content-encoding" not in identity.headers
+    assert gzipped.headers["content-encoding"] == "gzip"
+    assert identity.text == gzipped.text == TEXT
+    assert gzipped.headers["vary"] == "Accept-Encoding"
+
+
+def test_brotli_is_preferred(client):
+    if static.brotli is None:
+        pytest.skip("brotli is not installed")
+    response = _get(client, "/static/app.css", "gzip, br")
+    assert response.headers["content-encoding"] == "br"
+
+
+def test_each_content_coding_has_its_own_etag(client):
+    identity = _get(client, "/static/app.css", "identity").headers["etag"]
+    gzipped = _get(client, "/static/app.css", "gzip").headers["etag"]
+    assert identity != gzipped
+    assert gzipped.endswith('-gzip"')
+
+
+def test_not_modified_only_for_the_etag_of_the_chosen_coding(client):
+    identity = _get(client, "/static/app.css", "identity").headers["etag"]
+    gzipped = _get(client, "/static/app.css", "gzip").headers["etag"]
+
+    response = _get(client, "/static/app.css", "gzip", **{"if-none-match": gzipped})
+    assert response.status_code == 304
+    assert response.headers["etag"] == gzipped
+
+    response = _get(client, "/static/app.css", "gzip", **{"if-none-match": identity})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+
+    weak = f"W/{identity}"
+    response = _get(client, "/static/app.css", "identity", **{"if-none-match": weak})
+    assert response.status_code == 304
+
+
+def test_hashed_urls_are_immutable(client, static_files):
+    url = static_files.url("app.css")
+    assert url != "/static/app.css"
+    assert "immutable" in _get(client, url, "gzip").headers["cache-control"]
+    assert _get(client, "/static/app.css", "gzip").headers["cache-control"] == (
+        "no-cache"
+    )
+
+
+def test_static_files_are_not_compressed_on_the_fly(client):
+    response = _get(client, "/static/noise.bin", "gzip")
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == _get(
+        client, "/static/noise.bin", "identity"
+    ).headers["etag"]
+
+
+def test_other_paths_are_compressed(client):
+    assert _get(client, "/api", "gzip").headers["content-encoding"] == "gzip"
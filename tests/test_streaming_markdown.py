@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+from nicegui import Client, core, ui
+
+from hurag_webui.viewers.streaming_markdown import StreamingMarkdown
+
+
+def _deltas(client: Client) -> list[str]:
+    return [
+        message[2]["code"]
+        for message in client.outbox.messages
+        if message[1] == "run_javascript"
+    ]
+
+
+def test_stream_sends_only_the_delta(monkeypatch):
+    client = Client(ui.page("/"))
+    with client:
+        md = StreamingMarkdown()
+
+    async def run():
+        monkeypatch.setattr(core, "loop", asyncio.get_running_loop())
+        client.outbox.updates.clear()
+        await md.stream("第一段\n\n第二")
+        first = set(client.outbox.updates)
+        client.outbox.updates.clear()
+        await md.stream("第一段\n\n第二段\n\n第三")
+        await asyncio.sleep(0)  # the JavaScript is queued in background
+        return first
+
+    first = asyncio.run(run())
+    # The first chunk syncs the element in full, the next ones only the delta
+    assert md.id in first
+    assert md.id not in client.outbox.updates
+    deltas = _deltas(client)
+    assert len(deltas) == 1
+    assert json.dumps("第一段")[1:-1] not in deltas[0]
+    assert json.dumps("第二段")[1:-1] in deltas[0]
+    # The props still hold the whole text for a full sync
+    assert "第一段" in md.props["innerHTML"] and "第二段" in md.props["innerHTML"]
+
+
+def test_finish_sends_the_content_in_full():
+    client = Client(ui.page("/"))
+    with client:
+        md = StreamingMarkdown()
+
+    async def run():
+        await md.stream("第一段\n\n第二")
+        client.outbox.updates.clear()
+        md.finish("第一段\n\n第二段")
+
+    asyncio.run(run())
+    assert md.id in client.outbox.updates
+    assert "第二段" in md.props["innerHTML"]